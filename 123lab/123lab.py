@@ -1,76 +1,361 @@
 import math
+import threading
 import tkinter as tk
-from tkinter import Menu, ttk, messagebox
+from tkinter import Menu, ttk, messagebox, filedialog
+
+import numpy as np
+
+import raster
+from raster import Trace
+from scene import Scene, contains
+from profiler import Profiler, format_frame, profiled
+import scenefile
+from tiles import TileCache, level_for
+from worker import RenderWorker
 
 class DebugWindow(tk.Toplevel):
-    def __init__(self, master, width, height, offset_x=0, offset_y=0):
+    FRAME_DELAY = 50
+    CELL_SIZE = 8
+    MIN_CELL = 1
+    MAX_CELL = 64
+    ZOOM_STEP = 1.25
+    GRID_MIN = 4
+    BATCH_LIMIT = 256
+    FOLLOW_MARGIN = 2
+
+    def __init__(self, master, width=100, height=100):
         super().__init__(master)
         self.title("Режим отладки")
-        self.cell_size = 8
-        self.width = width
-        self.height = height
-        self.offset_x = offset_x   
-        self.offset_y = offset_y  
+        self.cell_size = self.CELL_SIZE
+        # Ячейка мира в левом верхнем углу холста (дробная при сдвиге мышью)
+        self.view_x = 0.0
+        self.view_y = 0.0
         
         
         canvas_width = width * self.cell_size
         canvas_height = height * self.cell_size
-        self.geometry(f"{canvas_width}x{canvas_height}")
+        self.geometry(f"{canvas_width}x{canvas_height + 40}")
+
+        controls = ttk.Frame(self)
+        controls.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+
+        ttk.Button(controls, text="⏮", width=3,
+                   command=lambda: self.seek(0)).pack(side=tk.LEFT)
+        self.play_button = ttk.Button(controls, text="▶", width=3, command=self.toggle_play)
+        self.play_button.pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text="⏭", width=3,
+                   command=lambda: self.seek(len(self.debug_steps))).pack(side=tk.LEFT)
+
+        self.step_scale = ttk.Scale(controls, from_=0, to=0, orient=tk.HORIZONTAL,
+                                    command=self.on_scale)
+        self.step_scale.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        ttk.Label(controls, text="Шагов за кадр:").pack(side=tk.LEFT)
+        self.speed_var = tk.StringVar(value="1")
+        ttk.Spinbox(controls, from_=1, to=10000, width=6,
+                    textvariable=self.speed_var).pack(side=tk.LEFT, padx=2)
+
+        self.follow_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls, text="Следовать",
+                        variable=self.follow_var).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text="Вся трасса", command=self.fit).pack(side=tk.LEFT)
         
         self.canvas = tk.Canvas(self, width=canvas_width, height=canvas_height, bg="white")
         self.canvas.pack(fill=tk.BOTH, expand=True)
-        
-        self.debug_steps = []
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<ButtonPress-1>", self.start_pan)
+        self.canvas.bind("<B1-Motion>", self.pan)
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.zoom(self.ZOOM_STEP, event.x, event.y))
+        self.canvas.bind("<Button-5>",
+                         lambda event: self.zoom(1 / self.ZOOM_STEP, event.x, event.y))
+        
+        self.debug_steps = Trace()
+        self.xs = np.empty(0, dtype=np.int64)
+        self.ys = np.empty(0, dtype=np.int64)
+        self.first = np.empty(0, dtype=bool)
         self.current_step = 0
         self.animation_id = None
-        self.drawn_points = set()   
-        
-    def draw_grid(self):
-        self.canvas.delete("all")
-       
-        for x in range(0, self.width * self.cell_size, self.cell_size):
-            self.canvas.create_line(x, 0, x, self.height * self.cell_size, fill="#EEE")
-        for y in range(0, self.height * self.cell_size, self.cell_size):
-            self.canvas.create_line(0, y, self.width * self.cell_size, y, fill="#EEE")
-            
-    def draw_pixel(self, x, y):
-        if (x, y) not in self.drawn_points:
-            
-            adj_x = x + self.offset_x
-            adj_y = y + self.offset_y
-            x0 = adj_x * self.cell_size
-            y0 = adj_y * self.cell_size
-            self.canvas.create_rectangle(
-                x0, y0,
-                x0 + self.cell_size,
-                y0 + self.cell_size,
-                fill="black",
-                outline=""
-            )
-            self.drawn_points.add((x, y))
-        
-    def show_step(self, step):
-        
-        for i in range(self.current_step + 1):
-            if i < len(self.debug_steps):
-                x = self.debug_steps[i]['x']
-                y = self.debug_steps[i]['y']
-                self.draw_pixel(x, y)
-        
-        
-        if step:
-            info_text = f"Шаг {self.current_step + 1}\n({step['x']}, {step['y']})"
+        self.pan_start = None
+        self.info_text = self.canvas.create_text(
+            10, 10,
+            anchor=tk.NW,
+            text="",
+            font=("Arial", 8),
+            fill="red"
+        )
+
+    def load(self, debug_steps):
+        self.pause()
+        self.debug_steps = debug_steps
+        # Ячейка каждого шага и признак того, что на этом шаге она закрашивается впервые
+        self.xs = np.floor(np.array(debug_steps.x, dtype=np.float64)).astype(np.int64)
+        self.ys = np.floor(np.array(debug_steps.y, dtype=np.float64)).astype(np.int64)
+        self.first = np.zeros(len(debug_steps), dtype=bool)
+        if len(debug_steps):
+            keys, _, _ = raster.pack_cells(np.column_stack((self.xs, self.ys)).astype(np.float64))
+            self.first[np.unique(keys, return_index=True)[1]] = True
+        self.current_step = 0
+        self.step_scale.configure(to=len(debug_steps))
+        self.step_scale.set(0)
+        self.redraw()
+
+    def view_size(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            # Окно ещё не показано
+            width = int(self.canvas["width"])
+            height = int(self.canvas["height"])
+        return width, height
+
+    def visible_cells(self):
+        width, height = self.view_size()
+        return (math.floor(self.view_x), math.floor(self.view_y),
+                math.floor(self.view_x + width / self.cell_size),
+                math.floor(self.view_y + height / self.cell_size))
+
+    def visible_steps(self, start, stop):
+        # Шаги из [start, stop), впервые закрашивающие видимую ячейку
+        x0, y0, x1, y1 = self.visible_cells()
+        xs = self.xs[start:stop]
+        ys = self.ys[start:stop]
+        shown = self.first[start:stop] & (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+        return np.flatnonzero(shown) + start
+
+    def cell_rect(self, x0, y, x1):
+        return ((x0 - self.view_x) * self.cell_size, (y - self.view_y) * self.cell_size,
+                (x1 + 1 - self.view_x) * self.cell_size, (y + 1 - self.view_y) * self.cell_size)
+
+    def redraw(self):
+        # Элементы холста есть только у видимой области: линии сетки и закрашенные
+        # ячейки, слитые в отрезки строк. Ячейки за краем окна не создаются
+        self.canvas.delete("grid", "cell")
+        width, height = self.view_size()
+        x0, y0, x1, y1 = self.visible_cells()
+        if self.cell_size >= self.GRID_MIN:
+            for x in range(x0, x1 + 1):
+                sx = (x - self.view_x) * self.cell_size
+                self.canvas.create_line(sx, 0, sx, height, fill="#EEE", tags="grid")
+            for y in range(y0, y1 + 1):
+                sy = (y - self.view_y) * self.cell_size
+                self.canvas.create_line(0, sy, width, sy, fill="#EEE", tags="grid")
+
+        shown = self.visible_steps(0, self.current_step)
+        spans = raster.pixel_spans(np.column_stack((self.xs[shown], self.ys[shown])))
+        for y, span_x0, span_x1 in spans.tolist():
+            self.canvas.create_rectangle(*self.cell_rect(span_x0, y, span_x1),
+                                         fill="black", outline="", tags="cell")
+        self.update_cursor()
+
+    def draw_cell(self, i):
+        x = int(self.xs[i])
+        return self.canvas.create_rectangle(*self.cell_rect(x, int(self.ys[i]), x),
+                                            fill="black", outline="", tags="cell")
+
+    def update_cursor(self):
+        # Ячейка текущего шага обводится красным
+        self.canvas.delete("cursor")
+        if self.current_step:
+            x = int(self.xs[self.current_step - 1])
+            y = int(self.ys[self.current_step - 1])
+            self.canvas.create_rectangle(*self.cell_rect(x, y, x), outline="red",
+                                         tags="cursor")
+        self.canvas.tag_raise(self.info_text)
+
+    def in_view(self, i):
+        x0, y0, x1, y1 = self.visible_cells()
+        margin = self.FOLLOW_MARGIN
+        return (x0 + margin <= self.xs[i] <= x1 - margin and
+                y0 + margin <= self.ys[i] <= y1 - margin)
+
+    def center_on(self, x, y):
+        width, height = self.view_size()
+        self.view_x = float(x) + 0.5 - width / self.cell_size / 2
+        self.view_y = float(y) + 0.5 - height / self.cell_size / 2
+        self.redraw()
+
+    def fit(self):
+        # Масштаб и сдвиг, при которых видна вся трасса
+        if not len(self.xs):
+            return
+        self.follow_var.set(False)
+        width, height = self.view_size()
+        x0, x1 = int(self.xs.min()), int(self.xs.max())
+        y0, y1 = int(self.ys.min()), int(self.ys.max())
+        cell_size = min(width / (x1 - x0 + 1), height / (y1 - y0 + 1))
+        self.cell_size = max(self.MIN_CELL, min(self.MAX_CELL, cell_size))
+        self.center_on((x0 + x1) / 2, (y0 + y1) / 2)
+
+    def zoom(self, factor, x, y):
+        # Точка под курсором остаётся на месте
+        cell_size = max(self.MIN_CELL, min(self.MAX_CELL, self.cell_size * factor))
+        world_x = self.view_x + x / self.cell_size
+        world_y = self.view_y + y / self.cell_size
+        self.cell_size = cell_size
+        self.view_x = world_x - x / cell_size
+        self.view_y = world_y - y / cell_size
+        self.redraw()
+
+    def on_wheel(self, event):
+        self.zoom(self.ZOOM_STEP if event.delta > 0 else 1 / self.ZOOM_STEP, event.x, event.y)
+
+    def start_pan(self, event):
+        self.follow_var.set(False)
+        self.pan_start = (event.x, event.y, self.view_x, self.view_y)
+
+    def pan(self, event):
+        x, y, view_x, view_y = self.pan_start
+        self.view_x = view_x - (event.x - x) / self.cell_size
+        self.view_y = view_y - (event.y - y) / self.cell_size
+        self.redraw()
+
+    def seek(self, step):
+        step = max(0, min(step, len(self.debug_steps)))
+        if self.follow_var.get() and step and not self.in_view(step - 1):
+            self.current_step = step
+            self.center_on(self.xs[step - 1], self.ys[step - 1])
+        elif step > self.current_step:
+            self.advance(step)
+        elif step < self.current_step:
+            self.current_step = step
+            self.redraw()
+        self.update_info()
+        if int(float(self.step_scale.get())) != step:
+            self.step_scale.set(step)
+
+    def advance(self, step):
+        # Дорисовываем только видимые ячейки, которые появляются впервые;
+        # если их много, проще перерисовать область отрезками строк
+        new = self.visible_steps(self.current_step, step)
+        self.current_step = step
+        if len(new) > self.BATCH_LIMIT:
+            self.redraw()
+            return
+        for i in new.tolist():
+            self.draw_cell(i)
+        self.update_cursor()
+
+    def update_info(self):
+        info_text = ""
+        if self.current_step:
+            step = self.debug_steps[self.current_step - 1]
+            info_text = f"Шаг {self.current_step}\n({step['x']}, {step['y']})"
             if 'error' in step:
                 info_text += f"\nОшибка: {step['error']}"
-            self.canvas.create_text(
-                10, 10,
-                anchor=tk.NW,
-                text=info_text,
-                font=("Arial", 8),
-                fill="red"
-            )
+        self.canvas.itemconfigure(self.info_text, text=info_text)
+        self.canvas.tag_raise(self.info_text)
+
+    def on_scale(self, value):
+        step = int(float(value))
+        if step != self.current_step:
+            self.pause()
+            self.seek(step)
+
+    def steps_per_frame(self):
+        try:
+            return max(1, int(self.speed_var.get()))
+        except ValueError:
+            return 1
+
+    def toggle_play(self):
+        if self.animation_id:
+            self.pause()
+        else:
+            self.play()
+
+    def play(self):
+        self.pause()
+        if self.current_step >= len(self.debug_steps):
+            self.seek(0)
+        self.play_button.configure(text="⏸")
+        self.animation_id = self.after(self.FRAME_DELAY, self.tick)
+
+    def pause(self):
+        if self.animation_id:
+            self.after_cancel(self.animation_id)
+            self.animation_id = None
+        self.play_button.configure(text="▶")
+
+    def tick(self):
+        self.animation_id = None
+        if not self.winfo_exists():
+            return
+        self.seek(self.current_step + self.steps_per_frame())
+        if self.current_step < len(self.debug_steps):
+            self.animation_id = self.after(self.FRAME_DELAY, self.tick)
+        else:
+            self.play_button.configure(text="▶")
+
+class Framebuffer:
+    def __init__(self, width, height, background=(255, 255, 255)):
+        self.width = width
+        self.height = height
+        self.background = np.array(background, dtype=np.uint8)
+        self.pixels = np.empty((height, width, 3), dtype=np.uint8)
+        self.clear()
+
+    def clear(self, rect=None):
+        x0, y0, x1, y1 = rect or (0, 0, self.width, self.height)
+        self.pixels[y0:y1, x0:x1] = self.background
+
+    def axis_lookup(self, cells, origin, cell_px, size, start, stop):
+        # Для каждого экранного столбца (строки) ищем диапазон ячеек, чьи квадраты его покрывают
+        starts = np.trunc(origin + cells * cell_px).astype(np.int64)
+        screen = np.arange(start, stop)
+        hi = np.searchsorted(starts, screen, side="right") - 1
+        lo = np.searchsorted(starts + size, screen, side="right")
+        covered = np.nonzero(hi >= lo)[0]
+        return screen[covered], lo[covered], hi[covered]
+
+    def draw_cells(self, xs, ys, rgb, origin, cell_px, size, clip=None):
+        x0, y0, x1, y1 = clip or (0, 0, self.width, self.height)
+        sx = np.trunc(origin[0] + xs * cell_px)
+        sy = np.trunc(origin[1] + ys * cell_px)
+        keep = (sx < x1) & (sx + size > x0) & (sy < y1) & (sy + size > y0)
+        if not keep.any():
+            return
+        ux, ix = np.unique(xs[keep], return_inverse=True)
+        uy, iy = np.unique(ys[keep], return_inverse=True)
+        rgb = rgb[keep]
+
+        grid = np.full((len(uy), len(ux)), -1, dtype=np.int64)
+        grid[iy, ix] = np.arange(len(ix))
+
+        cols, col_lo, col_hi = self.axis_lookup(ux, origin[0], cell_px, size, x0, x1)
+        rows, row_lo, row_hi = self.axis_lookup(uy, origin[1], cell_px, size, y0, y1)
+        if not len(cols) or not len(rows):
+            return
+
+        for dr in range(int((row_hi - row_lo).max()), -1, -1):
+            rsel = row_hi - row_lo >= dr
+            for dc in range(int((col_hi - col_lo).max()), -1, -1):
+                csel = col_hi - col_lo >= dc
+                block = grid[np.ix_(row_hi[rsel] - dr, col_hi[csel] - dc)]
+                mask = block >= 0
+                if not mask.any():
+                    continue
+                target = np.ix_(rows[rsel], cols[csel])
+                region = self.pixels[target]
+                region[mask] = rgb[block[mask]]
+                self.pixels[target] = region
+
+    def to_ppm(self):
+        header = f"P6 {self.width} {self.height} 255\n".encode("ascii")
+        return header + self.pixels.tobytes()
 
 class GraphicsEditor:
+    CONIC_STEP = 64
+    # При отдалении дальше одного экранного пикселя на ячейку рисуется мип-пирамида
+    MIN_ZOOM = 0.001
+    MAX_ZOOM = 5.0
+    # Опрос фонового построения и предел пикселей предпросмотра
+    POLL_DELAY = 30
+    PREVIEW_LIMIT = 20000
+    TARGET_FPS = 60
+    SETTLE_DELAY = 150
+    GRAYS = [f"#{gray:02x}{gray:02x}{gray:02x}" for gray in range(256)]
+
     def __init__(self, root):
         self.root = root
         self.root.title("Графический редактор")
@@ -83,6 +368,21 @@ class GraphicsEditor:
         self.curve_params = {}
         self.canvas_offset_x = 400 
         self.canvas_offset_y = 400
+        self.raster_cache = raster.RasterCache()
+        # Кэшем пользуются и окно, и фоновый поток построения. Замок повторно входимый:
+        # кривая берёт куски из кэша, пока её собственный расчёт ещё идёт
+        self.cache_lock = threading.RLock()
+        self.cache_size_var = tk.IntVar(value=raster.CACHE_BYTES // 2**20)
+        self.worker = RenderWorker()
+        self.active_job = None
+        self.job_poll = None
+        self.conic_extent = None
+        self.scene = Scene()
+        self.tiles = TileCache(self.scene)
+        self.profiler = Profiler()
+        self.profiler.listeners.append(self.update_hud)
+        self.hud_var = tk.BooleanVar(value=False)
+        self.memory_var = tk.BooleanVar(value=False)
 
         self.create_menu()
 
@@ -152,8 +452,29 @@ class GraphicsEditor:
                   command=self.draw_curve).pack(side=tk.LEFT)
 
         
+        render_frame = ttk.Frame(control_frame)
+        render_frame.grid(row=0, column=2, padx=10, sticky=tk.W)
+
+        ttk.Label(render_frame, text="Вывод:").pack(side=tk.LEFT)
+        self.render_mode_var = tk.StringVar(value="items")
+        ttk.Radiobutton(render_frame, text="Элементы", variable=self.render_mode_var,
+                       value="items", command=self.redraw_all).pack(side=tk.LEFT)
+        ttk.Radiobutton(render_frame, text="Буфер", variable=self.render_mode_var,
+                       value="raster", command=self.redraw_all).pack(side=tk.LEFT, padx=5)
+
+        job_frame = ttk.Frame(control_frame)
+        job_frame.grid(row=0, column=3, padx=10, sticky=tk.W)
+        self.job_progress = ttk.Progressbar(job_frame, mode="indeterminate", length=80)
+        self.job_progress.pack(side=tk.LEFT)
+        self.job_label = ttk.Label(job_frame, text="", width=12)
+        self.job_label.pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_frame, text="Отменить", command=self.cancel_job).pack(side=tk.LEFT)
+
+        
         
         self.curve_points = []
+        # Кривая, построенная по текущим точкам: правка точек перестраивает её
+        self.curve_primitive = None
         self.current_curve_type = "hermite"
 
         
@@ -165,14 +486,23 @@ class GraphicsEditor:
         )
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
+        self.framebuffer = Framebuffer(800, 800)
+        self.frame_photo = tk.PhotoImage(width=800, height=800)
+        self.rgb_cache = {}
+
         self.zoom_level = 1.0     
         self.offset_x = 0         
         self.offset_y = 0         
         self.drag_start = None
+        # Вид, в котором нарисовано содержимое холста, и отложенные кадры
+        self.shown_view = (0, 0, 1.0)
+        self.frame_job = None
+        self.settle_job = None
 
         self.canvas.bind("<MouseWheel>", self.zoom)
         self.canvas.bind("<ButtonPress-1>", self.start_drag)
         self.canvas.bind("<B1-Motion>", self.drag)
+        self.canvas.bind("<ButtonPress-3>", self.remove_at)
 
         
         self.debug_window = None
@@ -181,6 +511,11 @@ class GraphicsEditor:
 
     def create_menu(self):
         menubar = Menu(self.root)
+
+        file_menu = Menu(menubar, tearoff=0)
+        file_menu.add_command(label="Открыть сцену...", command=self.open_scene)
+        file_menu.add_command(label="Сохранить сцену...", command=self.save_scene)
+        menubar.add_cascade(label="Файл", menu=file_menu)
         
         curves_menu = Menu(menubar, tearoff=0)
         curves_menu.add_command(label="Окружность", command=lambda: self.set_curve_mode("circle"))
@@ -189,22 +524,85 @@ class GraphicsEditor:
         curves_menu.add_command(label="Парабола", command=lambda: self.set_curve_mode("parabola"))
         
         menubar.add_cascade(label="Линии второго порядка", menu=curves_menu)
+
+        cache_menu = Menu(menubar, tearoff=0)
+        cache_menu.add_command(label="Статистика", command=self.show_cache_stats)
+        cache_menu.add_command(label="Очистить", command=self.clear_cache)
+        size_menu = Menu(cache_menu, tearoff=0)
+        for size in (16, 64, 256):
+            size_menu.add_radiobutton(label=f"{size} МиБ", value=size,
+                                      variable=self.cache_size_var, command=self.resize_cache)
+        cache_menu.add_cascade(label="Объём", menu=size_menu)
+        menubar.add_cascade(label="Кэш", menu=cache_menu)
+
+        profile_menu = Menu(menubar, tearoff=0)
+        profile_menu.add_checkbutton(label="Показывать на холсте", variable=self.hud_var,
+                                     command=self.toggle_hud)
+        profile_menu.add_checkbutton(label="Учитывать память", variable=self.memory_var,
+                                     command=lambda: self.profiler.set_memory(
+                                         self.memory_var.get()))
+        profile_menu.add_command(label="Журнал в файл...", command=self.choose_profile_log)
+        profile_menu.add_command(label="Сводка", command=self.show_profile_summary)
+        menubar.add_cascade(label="Профилирование", menu=profile_menu)
         self.root.config(menu=menubar)
 
+    def choose_profile_log(self):
+        path = filedialog.asksaveasfilename(title="Журнал профилирования",
+                                            defaultextension=".jsonl",
+                                            filetypes=[("JSON Lines", "*.jsonl")])
+        self.profiler.log_path = path or None
+
+    def show_profile_summary(self):
+        summary = self.profiler.summary()
+        if not summary:
+            messagebox.showinfo("Профилирование", "Замеров пока нет")
+            return
+        lines = []
+        for name, entry in summary.items():
+            lines.append(f"{name}: {entry['frames']} раз, в среднем {entry['mean'] * 1000:.1f} мс, "
+                         f"максимум {entry['max'] * 1000:.1f} мс")
+            for stage, total in sorted(entry["stages"].items(), key=lambda item: -item[1]):
+                lines.append(f"    {stage}: {total / entry['frames'] * 1000:.1f} мс")
+        messagebox.showinfo("Профилирование", "\n".join(lines))
+
+    def toggle_hud(self):
+        if self.hud_var.get():
+            self.update_hud(self.profiler.last())
+        else:
+            self.canvas.delete("hud")
+
+    def update_hud(self, frame):
+        self.canvas.delete("hud")
+        if frame is None or not self.hud_var.get():
+            return
+        self.canvas.create_text(5, 5, anchor=tk.NW, text=format_frame(frame),
+                                font=("Courier", 9), fill="#c00000", tags="hud")
+
+    def clear_cache(self):
+        with self.cache_lock:
+            self.raster_cache.clear()
+
+    def resize_cache(self):
+        # При уменьшении лишние записи вытесняются сразу
+        with self.cache_lock:
+            self.raster_cache.resize(self.cache_size_var.get() * 2**20)
+
+    def show_cache_stats(self):
+        with self.cache_lock:
+            stats = self.raster_cache.stats()
+        messagebox.showinfo("Кэш растеризации",
+            f"Записей: {stats['entries']}\n"
+            f"Память: {stats['bytes'] / 2**20:.1f} из {stats['max_bytes'] / 2**20:.0f} МиБ\n"
+            f"Попаданий: {stats['hits']}, промахов: {stats['misses']} "
+            f"({stats['hit_rate']:.0%})\n"
+            f"Вытеснено: {stats['evictions']}")
+
     def get_coordinates(self):
         try:
-            max_coord = 800 // self.cell_size  
-            
             x0 = int(self.x0_entry.get())
             y0 = int(self.y0_entry.get())
             x1 = int(self.x1_entry.get())
             y1 = int(self.y1_entry.get())
-            
-           
-            if any(abs(val) > max_coord for val in [x0, y0, x1, y1]):
-                messagebox.showerror("Ошибка", 
-                    f"Координаты должны быть в пределах ±{max_coord}")
-                return None, None
                 
             return (x0, y0), (x1, y1)
         except ValueError:
@@ -217,21 +615,128 @@ class GraphicsEditor:
             return
         
         algorithm = self.algorithm_var.get()
+        trace = self.new_trace()
         if algorithm == "dda":
-            points, self.debug_steps = self.dda(start, end)
+            compute = lambda job: self.dda(start, end, trace, job)
         elif algorithm == "bresenham":
-            points, self.debug_steps = self.bresenham(start, end)
+            compute = lambda job: self.bresenham(start, end, trace, job)
         elif algorithm == "wu":
-            points, self.debug_steps = self.wu(start, end)
-        
-        self.canvas.delete("all")
-        self.draw_points(points)
-        
-        if self.debug_var.get():
+            compute = lambda job: self.wu(start, end, trace, job)
+
+        def finish(result):
+            points, self.debug_steps = result
+            self.add_primitive(algorithm, (start, end), points)
             
-            center_x = (start[0] + end[0]) // 2
-            center_y = (start[1] + end[1]) // 2
-            self.show_debug_window(self.debug_steps, center_x, center_y)
+            # Трасса создаётся при запуске: флажок могли переключить во время расчёта
+            if self.debug_steps is not None:
+                
+                center_x = (start[0] + end[0]) // 2
+                center_y = (start[1] + end[1]) // 2
+                self.show_debug_window(self.debug_steps, center_x, center_y)
+
+        self.run_job("line", compute, finish)
+
+    def new_trace(self):
+        return Trace() if self.debug_var.get() else None
+
+    def cached(self, key, iterate, trace, job=None, size=len):
+        # size — число пикселей результата: у заливок результат — отрезки строк
+        if job is not None:
+            return self.cached_job(key, iterate, trace, job, size)
+        # С трассой алгоритм проходится заново, иначе отладке нечего показать
+        with self.profiler.stage("rasterize"):
+            if trace is not None:
+                points = list(iterate(trace))
+            else:
+                points = self.cache_get(key, lambda: list(iterate(None)))
+        self.profiler.count("pixels", size(points))
+        return points, trace
+
+    def cached_job(self, key, iterate, trace, job, size=len):
+        # В фоновом потоке: без профилировщика
+        if trace is not None:
+            points = job.collect(iterate(trace))
+        else:
+            points = self.cache_get(key, lambda: job.collect(iterate(None)))
+        job.pixels += size(points)
+        return points, trace
+
+    def cache_get(self, key, compute):
+        # Кэш занимается только на поиск и запись, не на время расчёта: расчёт
+        # может идти параллельно в фоновом потоке и сам обращаться к кэшу.
+        # compute должен вернуть готовые пиксели, а не генератор
+        with self.cache_lock:
+            if key in self.raster_cache:
+                return self.raster_cache.get(key, None)
+        points = compute()
+        with self.cache_lock:
+            return self.raster_cache.get(key, lambda: points)
+
+    def run_job(self, name, compute, finish, preview=None, size=len):
+        # Построение уходит в фоновый поток, готовые куски показываются по мере
+        # поступления. Новое построение заменяет незаконченное. size считает
+        # пиксели в куске: у заливок куски — отрезки строк
+        self.cancel_job()
+        self.active_job = (name, finish, preview or self.preview_points, size)
+        self.job_pixels = 0
+        self.worker.submit(compute)
+        self.job_progress.start(self.POLL_DELAY)
+        self.job_poll = self.root.after(self.POLL_DELAY, self.poll_job)
+
+    def poll_job(self):
+        self.job_poll = None
+        name, finish, preview, size = self.active_job
+        # В растровом режиме холст — одно изображение, элементы предпросмотра
+        # легли бы поверх него, поэтому там виден только счётчик
+        show = not self.lod_level() and self.render_mode_var.get() != "raster"
+        for kind, value in self.worker.poll():
+            if kind == "chunk":
+                if show and self.job_pixels < self.PREVIEW_LIMIT:
+                    preview(value)
+                self.job_pixels += size(value)
+            elif kind == "error":
+                self.end_job()
+                messagebox.showerror("Ошибка", f"Не удалось построить: {value}")
+                return
+            else:
+                self.end_job()
+                result, seconds, pixels = value
+                with self.profiler.frame(name):
+                    self.profiler.record("rasterize", seconds)
+                    self.profiler.count("pixels", pixels)
+                    finish(result)
+                if name != "conics":
+                    # Пересчёт кривых, отложенный на время построения
+                    self.refresh_conics()
+                return
+        self.job_label.configure(text=f"{self.job_pixels} пикс.")
+        self.job_poll = self.root.after(self.POLL_DELAY, self.poll_job)
+
+    def preview_points(self, chunk):
+        points = raster.pixel_array(chunk)
+        x0, y0, x1, y1 = self.world_bounds()
+        inside = ((points[:, 0] >= x0) & (points[:, 0] <= x1) &
+                  (points[:, 1] >= y0) & (points[:, 1] <= y1))
+        self.draw_points_items(points[inside], ("primitive", "pending"))
+
+    def preview_spans(self, chunk):
+        spans = np.array(chunk, dtype=np.int64).reshape(-1, 3)
+        self.draw_spans_items(raster.clip_spans(spans, self.world_bounds()),
+                              ("primitive", "pending"))
+
+    def end_job(self):
+        if self.job_poll is not None:
+            self.root.after_cancel(self.job_poll)
+            self.job_poll = None
+        self.active_job = None
+        self.job_progress.stop()
+        self.job_label.configure(text="")
+        self.canvas.delete("pending")
+
+    def cancel_job(self):
+        self.worker.cancel()
+        if self.active_job is not None:
+            self.end_job()
 
     def setup_curve_ui(self):
         
@@ -243,55 +748,70 @@ class GraphicsEditor:
         curve_type_combo = ttk.Combobox(
             curve_control_frame,
             textvariable=self.curve_type_var,
-            values=["hermite", "bezier", "bspline"],
+            values=["hermite", "bezier", "bspline", "polygon"],
             state="readonly",
             width=10
         )
         curve_type_combo.pack(side=tk.LEFT, padx=5)
 
+        self.fill_rule_var = tk.StringVar(value="evenodd")
+        ttk.Combobox(
+            curve_control_frame,
+            textvariable=self.fill_rule_var,
+            values=list(raster.FILL_RULES),
+            state="readonly",
+            width=8
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Параметры B-сплайна: узлы — "uniform", "clamped" или числа через пробел
+        ttk.Label(curve_control_frame, text="Степень").pack(side=tk.LEFT)
+        self.degree_var = tk.StringVar(value="3")
+        ttk.Spinbox(curve_control_frame, from_=1, to=9, width=2,
+                    textvariable=self.degree_var).pack(side=tk.LEFT, padx=2)
+        ttk.Label(curve_control_frame, text="Узлы").pack(side=tk.LEFT)
+        self.knots_var = tk.StringVar(value="uniform")
+        ttk.Combobox(curve_control_frame, textvariable=self.knots_var,
+                     values=["uniform", "clamped"], width=10).pack(side=tk.LEFT, padx=2)
+        ttk.Label(curve_control_frame, text="Отсчёты").pack(side=tk.LEFT)
+        self.samples_var = tk.StringVar(value=str(raster.BSPLINE_SAMPLES))
+        ttk.Spinbox(curve_control_frame, from_=2, to=100000, width=6,
+                    textvariable=self.samples_var).pack(side=tk.LEFT, padx=2)
+
         
         ttk.Button(curve_control_frame, text="Добавить точку", 
                   command=self.add_curve_point).pack(side=tk.LEFT, padx=5)
+        ttk.Label(curve_control_frame, text="№").pack(side=tk.LEFT)
+        self.point_index_var = tk.StringVar(value="1")
+        ttk.Spinbox(curve_control_frame, from_=1, to=10000, width=4,
+                    textvariable=self.point_index_var).pack(side=tk.LEFT, padx=2)
+        ttk.Button(curve_control_frame, text="Переместить точку",
+                  command=self.move_curve_point).pack(side=tk.LEFT, padx=5)
+        ttk.Button(curve_control_frame, text="Удалить точку",
+                  command=self.delete_curve_point).pack(side=tk.LEFT, padx=5)
         ttk.Button(curve_control_frame, text="Очистить точки", 
                   command=self.clear_curve_points).pack(side=tk.LEFT, padx=5)
         ttk.Button(curve_control_frame, text="Построить кривую", 
                   command=self.draw_current_curve).pack(side=tk.LEFT, padx=5)
+        ttk.Button(curve_control_frame, text="Очистить сцену", 
+                  command=self.clear_scene).pack(side=tk.LEFT, padx=5)
         
 
     def show_debug_window(self, debug_steps, center_x=0, center_y=0):
-        
-        window_size = 100  
-        offset_x = (window_size // 2) - center_x
-        offset_y = (window_size // 2) - center_y
-        
         if not self.debug_window or not self.debug_window.winfo_exists():
-            self.debug_window = DebugWindow(
-                self.root, 
-                width=window_size,
-                height=window_size,
-                offset_x=offset_x,
-                offset_y=offset_y
-            )
+            self.debug_window = DebugWindow(self.root)
         
-        self.debug_window.debug_steps = debug_steps
-        self.debug_window.current_step = 0
-        self.debug_window.drawn_points.clear()
-        self.debug_window.draw_grid()
+        self.debug_window.load(debug_steps)
+        self.debug_window.center_on(center_x, center_y)
         self.animate_step()
 
 
     def animate_step(self):
         if self.debug_window and self.debug_window.winfo_exists():
-            if self.debug_window.current_step < len(self.debug_window.debug_steps):
-                step = self.debug_window.debug_steps[self.debug_window.current_step]
-                self.debug_window.show_step(step)
-                self.debug_window.current_step += 1
-                self.debug_window.animation_id = self.root.after(50, self.animate_step)
+            self.debug_window.play()
 
     def close_debug(self):
         if self.debug_window:
-            if self.debug_window.animation_id:
-                self.root.after_cancel(self.debug_window.animation_id)
+            self.debug_window.pause()
             self.debug_window.destroy()
         self.debug_var.set(False)
 
@@ -305,14 +825,208 @@ class GraphicsEditor:
     def zoom(self, event):
         scale_factor = 1.1 if event.delta > 0 else 0.9
         self.zoom_level *= scale_factor
-        self.zoom_level = max(0.1, min(5.0, self.zoom_level))  
+        self.zoom_level = max(self.MIN_ZOOM, min(self.MAX_ZOOM, self.zoom_level))  
+        self.schedule_redraw()
+
+    def schedule_redraw(self):
+        # Пачка событий ввода даёт не больше одного кадра за 1/TARGET_FPS секунды,
+        # а полная перерисовка выполняется, когда ввод затих на SETTLE_DELAY мс
+        if self.frame_job is None:
+            self.frame_job = self.root.after(1000 // self.TARGET_FPS, self.render_frame)
+        if self.settle_job is not None:
+            self.root.after_cancel(self.settle_job)
+        self.settle_job = self.root.after(self.SETTLE_DELAY, self.settle)
+
+    @profiled("frame")
+    def render_frame(self):
+        # Пока идёт ввод, уже нарисованное сдвигается и масштабируется средствами холста
+        self.frame_job = None
+        old_x, old_y, old_zoom = self.shown_view
+        scale = self.zoom_level / old_zoom
+        dx = (old_x - self.offset_x) * self.zoom_level
+        dy = (old_y - self.offset_y) * self.zoom_level
+        if self.render_mode_var.get() == "raster":
+            if scale != 1:
+                # Картинку холст масштабировать не умеет — буфер пересобирается
+                self.redraw_all()
+                return
+            self.canvas.move("framebuffer", dx, dy)
+        else:
+            self.canvas.scale("primitive", 800/2, 800/2, scale, scale)
+            self.canvas.move("primitive", dx, dy)
+        self.shown_view = (self.offset_x, self.offset_y, self.zoom_level)
+
+    def settle(self):
+        self.settle_job = None
         self.redraw_all()
 
+    def sync_view(self):
+        # Перед частичной перерисовкой холст должен совпадать с текущим видом
+        if self.shown_view != (self.offset_x, self.offset_y, self.zoom_level):
+            self.redraw_all()
+
+    def world_bounds(self, rect=(0, 0, 800, 800)):
+        # Ячейки, чьи квадраты задевают прямоугольник экрана, с запасом в одну ячейку
+        cell_px = self.cell_size * self.zoom_level
+        size = max(1, int(cell_px))
+        x0, y0, x1, y1 = rect
+        return (
+            math.floor((x0 - size - 800/2) / cell_px + self.offset_x / self.cell_size) - 1,
+            math.floor((y0 - size - 800/2) / cell_px + self.offset_y / self.cell_size) - 1,
+            math.ceil((x1 - 800/2) / cell_px + self.offset_x / self.cell_size) + 1,
+            math.ceil((y1 - 800/2) / cell_px + self.offset_y / self.cell_size) + 1,
+        )
+
+    def screen_rect(self, bounds):
+        x0, y0, x1, y1 = bounds
+        sx0, sy0 = self.transform_coords(x0, y0)
+        sx1, sy1 = self.transform_coords(x1, y1)
+        size = max(1, int(self.cell_size * self.zoom_level))
+        return max(0, sx0), max(0, sy0), min(800, sx1 + size), min(800, sy1 + size)
+
+    @profiled("redraw")
     def redraw_all(self):
         
-        self.canvas.delete("all")
-        if hasattr(self, 'last_drawn_points'):
-            self.draw_points(self.last_drawn_points)
+        if self.frame_job is not None:
+            self.root.after_cancel(self.frame_job)
+            self.frame_job = None
+        self.shown_view = (self.offset_x, self.offset_y, self.zoom_level)
+        with self.profiler.stage("conics"):
+            self.refresh_conics()
+        self.clear_canvas()
+        level = self.lod_level()
+        if level:
+            self.draw_lod(self.world_bounds(), level)
+            return
+        with self.profiler.stage("query"):
+            primitives = self.scene.query(self.world_bounds())
+        self.profiler.count("primitives", len(primitives))
+        self.draw_primitives(primitives, self.world_bounds())
+
+    def lod_level(self):
+        return level_for(self.cell_size * self.zoom_level)
+
+    def draw_lod(self, bounds, level):
+        # Вместо пикселей — занятые ячейки уровня level, цвет по их плотности
+        with self.profiler.stage("tiles"):
+            xs, ys, values = self.tiles.cells(bounds, level)
+        self.profiler.count("lod_cells", len(xs))
+        lod_px = self.cell_size * self.zoom_level * 2**level
+        origin = (800/2 - self.offset_x * self.zoom_level,
+                  800/2 - self.offset_y * self.zoom_level)
+        size = max(1, int(lod_px))
+        if self.render_mode_var.get() == "raster":
+            gray = 255 - values
+            with self.profiler.stage("framebuffer"):
+                self.framebuffer.draw_cells(xs, ys, np.column_stack((gray, gray, gray)),
+                                            origin, lod_px, size)
+            self.present_framebuffer()
+            return
+        with self.profiler.stage("items"):
+            for x, y, value in zip(xs.tolist(), ys.tolist(), values.tolist()):
+                screen_x = int(origin[0] + x * lod_px)
+                screen_y = int(origin[1] + y * lod_px)
+                color = self.GRAYS[255 - value]
+                self.canvas.create_rectangle(screen_x, screen_y, screen_x + size,
+                                             screen_y + size, fill=color, outline=color,
+                                             tags="primitive")
+
+    def redraw_region(self, bounds):
+        # В режиме буфера перерисовываем только экранный прямоугольник области
+        rect = self.screen_rect(bounds)
+        if rect[0] >= rect[2] or rect[1] >= rect[3]:
+            return
+        self.framebuffer.clear(rect)
+        world = self.world_bounds(rect)
+        self.draw_points_raster(self.gather_points(self.scene.query(world), world), clip=rect)
+
+    def gather_points(self, primitives, bounds):
+        parts = [raster.pixel_array(primitive.clip(bounds)) for primitive in primitives]
+        return np.concatenate(parts) if parts else np.empty((0, 3))
+
+    def draw_primitives(self, primitives, bounds):
+        if self.render_mode_var.get() == "raster":
+            self.draw_points_raster(self.gather_points(primitives, bounds))
+        else:
+            for primitive in primitives:
+                with self.profiler.stage("spans"):
+                    spans = primitive.clip_spans(bounds)
+                self.draw_spans_items(spans, ("primitive", f"p{primitive.id}"))
+
+    def add_primitive(self, kind, params, points, extent=None, spans=None):
+        if not len(points) and extent is None:
+            return None
+        self.sync_view()
+        primitive = self.scene.add(kind, params, points, extent, spans)
+        if self.lod_level():
+            # Плитки под примитивом уже сброшены сценой и пересоберутся при перерисовке
+            self.redraw_all()
+        elif primitive.antialiased and self.render_mode_var.get() == "raster":
+            # Сглаженный примитив смешивается с тем, что под ним, поэтому область пересобирается
+            self.redraw_region(primitive.bounds)
+        else:
+            self.draw_primitives([primitive], self.world_bounds())
+        return primitive
+
+    @profiled("remove")
+    def remove_primitive(self, primitive):
+        self.sync_view()
+        self.scene.remove(primitive.id)
+        if self.lod_level():
+            self.redraw_all()
+        elif self.render_mode_var.get() == "raster":
+            self.redraw_region(primitive.bounds)
+        else:
+            self.canvas.delete(f"p{primitive.id}")
+
+    def remove_at(self, event):
+        cell_px = self.cell_size * self.zoom_level
+        x = math.floor((event.x - 800/2) / cell_px + self.offset_x / self.cell_size)
+        y = math.floor((event.y - 800/2) / cell_px + self.offset_y / self.cell_size)
+        primitive = self.scene.hit_test(x, y, radius=max(1, 2 / cell_px))
+        if primitive is not None:
+            self.remove_primitive(primitive)
+
+    def clear_scene(self):
+        self.cancel_job()
+        self.scene.clear()
+        self.curve_primitive = None
+        self.clear_canvas()
+
+    SCENE_FILETYPES = [("Сцена", "*.gsc"), ("Все файлы", "*.*")]
+
+    def save_scene(self):
+        path = filedialog.asksaveasfilename(title="Сохранить сцену", defaultextension=".gsc",
+                                            filetypes=self.SCENE_FILETYPES)
+        if not path:
+            return
+        try:
+            scenefile.save_scene(path, self.scene, self.curve_points)
+        except OSError as error:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить сцену: {error}")
+
+    def open_scene(self):
+        path = filedialog.askopenfilename(title="Открыть сцену",
+                                          filetypes=self.SCENE_FILETYPES)
+        if not path:
+            return
+        try:
+            scene_file = scenefile.SceneFile(path)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            messagebox.showerror("Ошибка", f"Не удалось открыть сцену: {error}")
+            return
+        self.load_scene(scene_file)
+
+    @profiled("load")
+    def load_scene(self, scene_file):
+        # Точки остаются отображёнными в память: в кадр попадают только видимые
+        self.cancel_job()
+        self.scene.clear()
+        for record in scene_file:
+            self.scene.add_record(record)
+        self.curve_points = list(scene_file.control_points)
+        self.curve_primitive = None
+        self.redraw_all()
 
     def start_drag(self, event):
         self.drag_start = (event.x, event.y)
@@ -324,178 +1038,100 @@ class GraphicsEditor:
             self.offset_x += dx / self.zoom_level
             self.offset_y += dy / self.zoom_level
             self.drag_start = (event.x, event.y)
-            self.redraw_all()
+            self.schedule_redraw()
 
-    def draw_points(self, points):
-        for point in points:
-            if len(point) == 3:
-                x, y, color = point
-            else:
-                x, y = point
-                color = "black"
-                
-            
-            screen_x, screen_y = self.transform_coords(x, y)
-            
-            
+    def clear_canvas(self):
+        self.canvas.delete("all")
+        self.framebuffer.clear()
+
+    def color_rgb(self, color):
+        if color not in self.rgb_cache:
+            r, g, b = self.canvas.winfo_rgb(color)
+            self.rgb_cache[color] = (r >> 8, g >> 8, b >> 8)
+        return self.rgb_cache[color]
+
+    def draw_points_raster(self, points, clip=None):
+        points = raster.pixel_array(points)
+        if len(points):
+            # Все пиксели смешиваются в одном буфере покрытия, непрозрачные — с покрытием 1
+            with self.profiler.stage("composite"):
+                coverage = raster.CoverageBuffer()
+                coverage.deposit(points[:, :2], points[:, 2], self.color_rgb("black"))
+                coords, rgb = coverage.resolve(self.framebuffer.background)
+
+            cell_px = self.cell_size * self.zoom_level
+            origin = (800/2 - self.offset_x * self.zoom_level,
+                      800/2 - self.offset_y * self.zoom_level)
             size = max(1, int(self.cell_size * self.zoom_level))
-            
-            self.canvas.create_rectangle(
-                screen_x,
-                screen_y,
-                screen_x + size,
-                screen_y + size,
-                fill=color,
-                outline=color
-            )
-        
-        
-        self.last_drawn_points = points
-
-    def dda(self, start, end):
-        debug_steps = []
-        x1, y1 = start
-        x2, y2 = end
-        dx = x2 - x1
-        dy = y2 - y1
-        steps = max(abs(dx), abs(dy))
-        
-        if steps == 0:
-            return [], []
-        
-        x_inc = dx / steps
-        y_inc = dy / steps
-        x, y = x1, y1
-        
-        points = []
-        debug_steps = []
-        
-        for _ in range(steps + 1):
-            rx, ry = round(x), round(y)
-            points.append((rx, ry))
-            debug_steps.append({'x': rx, 'y': ry})
-            x += x_inc
-            y += y_inc
-        
-        for _ in range(steps + 1):
-            debug_steps.append({'x': rx, 'y': ry})  
-        return points, debug_steps
-    def bresenham(self, start, end):
-        x1, y1 = start
-        x2, y2 = end
-        dx = abs(x2 - x1)
-        dy = abs(y2 - y1)
-        steep = dy > dx
-        
-        if steep:
-            x1, y1 = y1, x1
-            x2, y2 = y2, x2
-            dx, dy = dy, dx
-        
-        if x1 > x2:
-            x1, x2 = x2, x1
-            y1, y2 = y2, y1
-        
-        dx = x2 - x1
-        dy = abs(y2 - y1)
-        error = dx // 2
-        y_step = 1 if y1 < y2 else -1
-        y = y1
-        
-        points = []
-        debug_steps = []
-        
-        for x in range(x1, x2 + 1):
-            coord = (y, x) if steep else (x, y)
-            points.append(coord)
-            debug_steps.append({'x': coord[0], 'y': coord[1], 'error': error})
-            error -= dy
-            if error < 0:
-                y += y_step
-                error += dx
-        
-        return points, debug_steps
-
-    def wu(self, start, end):
-        import math
-        x1, y1 = start
-        x2, y2 = end
-        points = []
-        debug_steps = []
-
-        def plot(x, y, intensity):
-            
-            gray = int(255 * intensity)
-            color = f'#{gray:02x}{gray:02x}{gray:02x}'
-            points.append((x, y, color))
-            debug_steps.append({'x': x, 'y': y})
-
-        dx = x2 - x1
-        dy = y2 - y1
-
-        steep = abs(dy) > abs(dx)
-
-        
-        if steep:
-            x1, y1 = y1, x1
-            x2, y2 = y2, x2
-            dx, dy = dy, dx
-
-        if x1 > x2:
-            x1, x2 = x2, x1
-            y1, y2 = y2, y1
-
-        gradient = dy / dx if dx != 0 else 1.0
-
-        
-        xend = round(x1)
-        yend = y1 + gradient * (xend - x1)
-        xgap = 1 - (x1 + 0.5) % 1 
-
-        xpxl1 = xend
-        yfrac, ywhole = math.modf(yend)
-        ypxl1 = int(ywhole)
-
-        if steep:
-            
-            plot(ypxl1, xpxl1, (1 - yfrac) * xgap)
-            plot(ypxl1 + 1, xpxl1, yfrac * xgap)
-        else:
-            plot(xpxl1, ypxl1, (1 - yfrac) * xgap)
-            plot(xpxl1, ypxl1 + 1, yfrac * xgap)
-
-        intery = yend + gradient
-
-        
-        xend = round(x2)
-        yend = y2 + gradient * (xend - x2)
-        xgap = (x2 + 0.5) % 1
-
-        xpxl2 = xend
-        yfrac, ywhole = math.modf(yend)
-        ypxl2 = int(ywhole)
-
-        if steep:
-            plot(ypxl2, xpxl2, (1 - yfrac) * xgap)
-            plot(ypxl2 + 1, xpxl2, yfrac * xgap)
-        else:
-            plot(xpxl2, ypxl2, (1 - yfrac) * xgap)
-            plot(xpxl2, ypxl2 + 1, yfrac * xgap)
-
-        
-        for x in range(xpxl1 + 1, xpxl2):
-            yfrac, ywhole = math.modf(intery)
-            y = int(ywhole)
-            if steep:
-                
-                plot(y, x, 1 - yfrac)
-                plot(y + 1, x, yfrac)
-            else:
-                plot(x, y, 1 - yfrac)
-                plot(x, y + 1, yfrac)
-            intery += gradient
-
-        return points, debug_steps
+            with self.profiler.stage("framebuffer"):
+                self.framebuffer.draw_cells(coords[:, 0], coords[:, 1], rgb, origin, cell_px,
+                                            size, clip)
+            self.profiler.count("cells", len(coords))
+
+        self.present_framebuffer()
+
+    def present_framebuffer(self):
+        with self.profiler.stage("present"):
+            self.frame_photo.configure(data=self.framebuffer.to_ppm(), format="PPM")
+            if not self.canvas.find_withtag("framebuffer"):
+                self.canvas.create_image(0, 0, anchor=tk.NW, image=self.frame_photo,
+                                         tags="framebuffer")
+                self.canvas.tag_lower("framebuffer")
+
+    def draw_points_items(self, points, tags=()):
+        with self.profiler.stage("spans"):
+            spans = raster.pixel_spans(points)
+        self.draw_spans_items(spans, tags)
+
+    def draw_spans_items(self, spans, tags=()):
+        # Отрезок строки — один прямоугольник вместо элемента на каждый пиксель.
+        # У сглаженных отрезков четвёртый столбец — покрытие
+        size = max(1, int(self.cell_size * self.zoom_level))
+        with self.profiler.stage("transform"):
+            rects = []
+            for span in spans.tolist():
+                y, x0, x1 = span[:3]
+                if len(span) == 4:
+                    color = self.GRAYS[round(255 * (1 - min(max(span[3], 0), 1)))]
+                else:
+                    color = "black"
+                screen_x0, screen_y = self.transform_coords(x0, y)
+                screen_x1, _ = self.transform_coords(x1, y)
+                rects.append((screen_x0, screen_y, screen_x1, color))
+
+        with self.profiler.stage("items"):
+            for screen_x0, screen_y, screen_x1, color in rects:
+                self.canvas.create_rectangle(
+                    screen_x0,
+                    screen_y,
+                    screen_x1 + size,
+                    screen_y + size,
+                    fill=color,
+                    outline=color,
+                    tags=tags
+                )
+        self.profiler.count("items", len(rects))
+
+    def dda(self, start, end, trace=None, job=None):
+        return self.cached(("dda", start, end),
+                           lambda trace: self.iter_dda(start, end, trace), trace, job)
+
+    def iter_dda(self, start, end, trace=None):
+        return raster.iter_dda(start, end, trace)
+
+    def bresenham(self, start, end, trace=None, job=None):
+        return self.cached(("bresenham", start, end),
+                           lambda trace: self.iter_bresenham(start, end, trace), trace, job)
+
+    def iter_bresenham(self, start, end, trace=None):
+        return raster.iter_bresenham(start, end, trace)
+
+    def wu(self, start, end, trace=None, job=None):
+        return self.cached(("wu", start, end),
+                           lambda trace: self.iter_wu(start, end, trace), trace, job)
+
+    def iter_wu(self, start, end, trace=None):
+        return raster.iter_wu(start, end, trace)
     
 
     def set_curve_mode(self, mode):
@@ -547,336 +1183,350 @@ class GraphicsEditor:
             messagebox.showerror("Ошибка", "Координаты центра должны быть целыми числами")
             return
 
-        points = []
-        debug_steps = [] 
+        # Параметры фиксируются до запуска: окно параметров меняет словарь на месте
+        mode = self.current_mode
+        params = dict(self.curve_params)
+        compute = None
+        extent = None
+        trace = self.new_trace()
 
-        if self.current_mode == "circle":
-            if "radius" not in self.curve_params:
+        if mode == "circle":
+            if "radius" not in params:
                 messagebox.showerror("Ошибка", "Не задан радиус")
                 return
-            points, debug_steps = self.bresenham_circle(x0, y0, self.curve_params["radius"])
+            compute = lambda job: self.bresenham_circle(x0, y0, params["radius"], trace, job)
         
-        elif self.current_mode == "ellipse":
-            if "a" not in self.curve_params or "b" not in self.curve_params:
+        elif mode == "ellipse":
+            if "a" not in params or "b" not in params:
                 messagebox.showerror("Ошибка", "Задайте параметры a и b для эллипса")
                 return
-            points, debug_steps = self.midpoint_ellipse(
+            compute = lambda job: self.midpoint_ellipse(
                 x0, y0, 
-                self.curve_params["a"], 
-                self.curve_params["b"]
+                params["a"], 
+                params["b"],
+                trace,
+                job
             )
 
-        elif self.current_mode == "hyperbola":
-            if "a" not in self.curve_params or "b" not in self.curve_params:
+        elif mode == "hyperbola":
+            if "a" not in params or "b" not in params:
                 messagebox.showerror("Ошибка", "Задайте параметры a и b для гиперболы")
                 return
-            points, debug_steps = self.bresenham_hyperbola(
+            extent = self.conic_bounds()
+            compute = lambda job: self.bresenham_hyperbola(
                 x0, y0,
-                self.curve_params["a"],
-                self.curve_params["b"]
+                params["a"],
+                params["b"],
+                trace,
+                extent,
+                job
             )
 
-        elif self.current_mode == "parabola":
-            if "p" not in self.curve_params:
+        elif mode == "parabola":
+            if "p" not in params:
                 messagebox.showerror("Ошибка", "Задайте параметр p для параболы")
                 return
-            points, debug_steps = self.midpoint_parabola(
+            extent = self.conic_bounds()
+            compute = lambda job: self.midpoint_parabola(
                 x0, y0,
-                self.curve_params["p"]
+                params["p"],
+                trace,
+                extent,
+                job
             )
 
-        self.canvas.delete("all")
-        self.draw_points(points)
-        
-        if self.debug_var.get():
-            
-            self.show_debug_window(debug_steps, x0, y0)
-
-    def bresenham_hyperbola(self, xc, yc, a, b):
-        points = []
-        debug_steps = []
-        x = a
-        y = 0
-        a_sq = a * a
-        b_sq = b * b
-        d = 2 * a_sq - 2 * a * b_sq - b_sq
-        
-        while x <= 200:
-            self.add_hyperbola_points(xc, yc, x, y, points, debug_steps)
-            debug_steps.append({'x': xc + x, 'y': yc + y, 'error': d})
-            
-            if d < 0:
-                d += 2 * a_sq * (2 * y + 3)
-            else:
-                d += 2 * a_sq * (2 * y + 3) - 4 * b_sq * (x + 1)
-                x += 1
-            y += 1
-        
-        return points, debug_steps
+        if compute is None:
+            return
 
-    
-    def add_hyperbola_points(self, xc, yc, x, y, points, debug_steps):
-        max_coord = 800 // self.cell_size
-        for sx, sy in [(1,1), (1,-1)]:  
-            xi = xc + x * sx
-            yi = yc + y * sy
-            if abs(xi) <= max_coord and abs(yi) <= max_coord:
-                points.append((xi, yi))
-                debug_steps.append({'x': xi, 'y': yi})
-
-    def midpoint_parabola(self, xc, yc, p):
-        points = []
-        debug_steps = []
-        x = 0
-        y = 0
-        d = 1 - p
-        
-        while x <= 200:
-            self.add_parabola_points(xc, yc, x, y, points, debug_steps)
-            debug_steps.append({'x': xc + x, 'y': yc + y, 'error': d})
+        def finish(result):
+            points, debug_steps = result
+            self.add_primitive(mode, (x0, y0, params), points, extent)
             
-            if d < 0:
-                d += 2 * y + 3
-            else:
-                d += 2 * y + 3 - 4 * p
-                x += 1
-            y += 1
-        
-        return points, debug_steps
-
-    def add_parabola_points(self, xc, yc, x, y, points, debug_steps):
-        max_coord = 800 // self.cell_size
-        for sy in [1, -1]:  
-            xi = xc + x
-            yi = yc + y * sy
-            if abs(xi) <= max_coord and abs(yi) <= max_coord:
-                points.append((xi, yi))
-                debug_steps.append({'x': xi, 'y': yi})
+            if debug_steps is not None:
+                
+                self.show_debug_window(debug_steps, x0, y0)
+
+        self.run_job("curve", compute, finish)
+
+    def bresenham_hyperbola(self, xc, yc, a, b, trace=None, bounds=None, job=None):
+        bounds = bounds or self.conic_bounds()
+        return self.cached(("hyperbola", xc, yc, a, b, bounds),
+                           lambda trace: self.iter_bresenham_hyperbola(xc, yc, a, b, trace,
+                                                                       bounds),
+                           trace, job)
+
+    def iter_bresenham_hyperbola(self, xc, yc, a, b, trace=None, bounds=None):
+        return raster.iter_bresenham_hyperbola(xc, yc, a, b, trace,
+                                               bounds=bounds or self.conic_bounds())
+
+    def midpoint_parabola(self, xc, yc, p, trace=None, bounds=None, job=None):
+        bounds = bounds or self.conic_bounds()
+        return self.cached(("parabola", xc, yc, p, bounds),
+                           lambda trace: self.iter_midpoint_parabola(xc, yc, p, trace, bounds),
+                           trace, job)
+
+    def iter_midpoint_parabola(self, xc, yc, p, trace=None, bounds=None):
+        return raster.iter_midpoint_parabola(xc, yc, p, trace,
+                                             bounds=bounds or self.conic_bounds())
+
+    def conic_bounds(self):
+        # Видимая область с запасом в половину размера, выровненная по сетке:
+        # небольшой сдвиг или масштаб не требует пересчёта открытых кривых
+        x0, y0, x1, y1 = self.world_bounds()
+        margin = max(x1 - x0, y1 - y0) // 2
+        step = self.CONIC_STEP
+        return (
+            math.floor((x0 - margin) / step) * step,
+            math.floor((y0 - margin) / step) * step,
+            math.ceil((x1 + margin) / step) * step,
+            math.ceil((y1 + margin) / step) * step,
+        )
 
-    
-    def bresenham_circle(self, xc, yc, r):
-        points = []
-        debug_steps = []
-        x = 0
-        y = r
-        delta = 2 - 2 * r 
-        limit = 0  
-
-        while y > limit:
-            
-            self.add_circle_points(xc, yc, x, y, points, debug_steps)
-            
-            delta_star = 2 * delta - 2 * x - 1
-            
-            if delta_star > 0:
-                y -= 1
-                delta += -2 * y + 1
-            else:
-                delta_new = 2 * delta + 2 * y - 1
-                if delta_new > 0:
-                    x += 1
-                    y -= 1
-                    delta += 2 * (x - y) + 2
+    def refresh_conics(self):
+        # Гиперболу и параболу пересчитываем в фоне, когда видимая область вышла за
+        # растеризованную; до конца расчёта видна прежняя часть кривой
+        bounds = self.world_bounds()
+        stale = [primitive for primitive in self.scene.unbounded()
+                 if not contains(primitive.extent, bounds)]
+        if not stale:
+            return
+        if self.active_job is not None:
+            # Построение пользователя не прерываем: пересчёт будет после него.
+            # Идущий пересчёт заменяем, только если он не покрывает видимую область
+            if self.active_job[0] != "conics" or contains(self.conic_extent, bounds):
+                return
+        extent = self.conic_bounds()
+        conics = [(primitive.id, primitive.kind, primitive.params) for primitive in stale]
+
+        def compute(job):
+            results = []
+            for id, kind, params in conics:
+                xc, yc, values = params
+                if kind == "hyperbola":
+                    points, _ = self.bresenham_hyperbola(xc, yc, values["a"], values["b"],
+                                                         bounds=extent, job=job)
                 else:
-                    x += 1
-                    delta += 2 * x + 1
-            
-            debug_steps.append({
-                'x': xc + x,
-                'y': yc + y,
-                'error': delta,
-                'action': 'V' if delta_star > 0 else 'D' if delta_new > 0 else 'H'
-            })
-        
-        return points, debug_steps
-
-    def add_circle_points(self, xc, yc, x, y, points, debug_steps):
-        max_coord = 800 // self.cell_size
-        for sx, sy in [(1,1), (-1,1), (1,-1), (-1,-1)]:
-            for px, py in [(x, y), (y, x)]:
-                xi = xc + px*sx
-                yi = yc + py*sy
-                if abs(xi) <= max_coord and abs(yi) <= max_coord:
-                    points.append((xi, yi))
-                    debug_steps.append({'x': xi, 'y': yi})
+                    points, _ = self.midpoint_parabola(xc, yc, values["p"], bounds=extent,
+                                                       job=job)
+                results.append((id, params, points))
+            return results
+
+        def finish(results):
+            for id, params, points in results:
+                # Пока шёл расчёт, примитив могли удалить
+                if id in self.scene and self.scene[id].params is params:
+                    self.scene.update(id, points, extent)
+            self.redraw_all()
+
+        self.conic_extent = extent
+        self.run_job("conics", compute, finish, lambda chunk: None)
 
     
-    def midpoint_ellipse(self, xc, yc, a, b):
-        points = []
-        debug_steps = []
-        x = 0
-        y = b
-        a2 = a * a
-        b2 = b * b
-        delta = a2 + b2 - 2 * a2 * b 
-
-        while y >= 0:
-            self.add_ellipse_points(xc, yc, x, y, points, debug_steps)
-            debug_steps.append({'x': xc + x, 'y': yc + y, 'error': delta})
-
-            if delta < 0:
-                delta_star = 2 * (delta + a2 * y) - 1
-                if delta_star <= 0:
-                    delta += b2 * (2 * x + 1)
-                    x += 1
-                else:
-                    delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
-                    x += 1
-                    y -= 1
-            elif delta > 0:
-                delta_star = 2 * (delta - b2 * x) - 1
-                if delta_star <= 0:
-                    delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
-                    x += 1
-                    y -= 1
-                else:
-                    delta += a2 * (1 - 2 * y)
-                    y -= 1
-            else:
-                delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
-                x += 1
-                y -= 1
+    def bresenham_circle(self, xc, yc, r, trace=None, job=None):
+        return self.cached(("circle", xc, yc, r),
+                           lambda trace: self.iter_bresenham_circle(xc, yc, r, trace), trace, job)
+
+    def iter_bresenham_circle(self, xc, yc, r, trace=None):
+        if trace is None:
+            return map(tuple, raster.circle_pixels(xc, yc, r, math.inf).tolist())
+        return raster.iter_bresenham_circle(xc, yc, r, trace, math.inf)
 
-        return points, debug_steps
+    
+    def midpoint_ellipse(self, xc, yc, a, b, trace=None, job=None):
+        return self.cached(("ellipse", xc, yc, a, b),
+                           lambda trace: self.iter_midpoint_ellipse(xc, yc, a, b, trace),
+                           trace, job)
 
-    def add_ellipse_points(self, xc, yc, x, y, points, debug_steps):
-        for sx, sy in [(1,1), (-1,1), (1,-1), (-1,-1)]:
-            points.append((xc + x*sx, yc + y*sy))
-            debug_steps.append({'x': xc + x*sx, 'y': yc + y*sy})
+    def iter_midpoint_ellipse(self, xc, yc, a, b, trace=None):
+        if trace is None:
+            return map(tuple, raster.ellipse_pixels(xc, yc, a, b).tolist())
+        return raster.iter_midpoint_ellipse(xc, yc, a, b, trace)
 
     def add_curve_point(self):
         try:
             x = int(self.x0_entry.get())
             y = int(self.y0_entry.get())
-            self.curve_points.append((x, y))
-            messagebox.showinfo("Точка добавлена", f"Точка ({x}, {y}) добавлена")
         except ValueError:
             messagebox.showerror("Ошибка", "Некорректные координаты точки")
+            return
+        self.curve_points.append((x, y))
+        messagebox.showinfo("Точка добавлена", f"Точка ({x}, {y}) добавлена")
+        self.update_current_curve()
+
+    def curve_point_index(self):
+        try:
+            index = int(self.point_index_var.get()) - 1
+        except ValueError:
+            index = -1
+        if not 0 <= index < len(self.curve_points):
+            messagebox.showerror("Ошибка", f"Нет точки с номером {self.point_index_var.get()}")
+            return None
+        return index
+
+    def move_curve_point(self):
+        index = self.curve_point_index()
+        if index is None:
+            return
+        try:
+            x = int(self.x0_entry.get())
+            y = int(self.y0_entry.get())
+        except ValueError:
+            messagebox.showerror("Ошибка", "Некорректные координаты точки")
+            return
+        self.curve_points[index] = (x, y)
+        self.update_current_curve()
+
+    def delete_curve_point(self):
+        index = self.curve_point_index()
+        if index is None:
+            return
+        del self.curve_points[index]
+        self.update_current_curve()
+
+    def update_current_curve(self):
+        # Построенная кривая перестраивается, пока точки дают допустимую кривую;
+        # неизменившиеся куски берутся из кэша
+        primitive = self.curve_primitive
+        if primitive is None or primitive.id not in self.scene:
+            return
+        if len(self.curve_points) < 2 or self.curve_points_error(self.curve_type_var.get()):
+            return
+        self.draw_current_curve(replace=primitive)
 
     def clear_curve_points(self):
         self.curve_points = []
-        self.canvas.delete("all")
+        self.curve_primitive = None
 
-    def draw_current_curve(self):
+    def draw_current_curve(self, replace=None):
         if len(self.curve_points) < 2:
             messagebox.showerror("Ошибка", "Добавьте минимум 2 точки")
             return
 
         curve_type = self.curve_type_var.get()
-        points = []
-        debug_steps = []
+        error = self.curve_points_error(curve_type)
+        if error:
+            messagebox.showerror("Ошибка", error)
+            return
+
+        params = tuple(self.curve_points)
+        rule = self.fill_rule_var.get()
+        trace = self.new_trace()
+        preview = None
+        size = len
 
         if curve_type == "hermite":
-            points, debug_steps = self.draw_hermite()
+            compute = lambda job: self.draw_hermite(params, trace, job)
         elif curve_type == "bezier":
-            points, debug_steps = self.draw_bezier()
+            compute = lambda job: self.draw_bezier(params, trace, job)
         elif curve_type == "bspline":
-            points, debug_steps = self.draw_bspline()
-
-        self.draw_points(points)
-        
-        if self.debug_var.get():
-            self.show_debug_window(debug_steps)
-
-
-    def draw_hermite(self):
-        points = []
-        debug_steps = []
-        for i in range(len(self.curve_points) - 1):
-            p0 = self.curve_points[i]
-            p1 = self.curve_points[i + 1]
+            bspline = self.bspline_options()
+            compute = lambda job: self.draw_bspline(params, *bspline, trace, job)
+        elif curve_type == "polygon":
+            compute = lambda job: self.draw_polygon(params, rule, trace, job)
+            preview = self.preview_spans
+            size = raster.span_count
+
+        def finish(result):
+            points, debug_steps = result
+            if replace is not None and replace.id in self.scene:
+                self.remove_primitive(replace)
+            if curve_type == "polygon":
+                spans = points
+                points = raster.span_pixels(spans)
+                self.curve_primitive = self.add_primitive(curve_type, (params, rule), points,
+                                                          spans=spans)
+            elif curve_type == "bspline":
+                self.curve_primitive = self.add_primitive(curve_type, (params, *bspline), points)
+            else:
+                self.curve_primitive = self.add_primitive(curve_type, params, points)
             
-            t0 = 0
-            if i > 0:
-                t0 = (p1[0] - self.curve_points[i-1][0]) / 2
-                
-            t1 = 0
-            if i < len(self.curve_points) - 2:
-                t1 = (self.curve_points[i+2][0] - p0[0]) / 2
-
-            for t in [x * 0.01 for x in range(101)]:
-                h1 = 2*t**3 - 3*t**2 + 1
-                h2 = -2*t**3 + 3*t**2
-                h3 = t**3 - 2*t**2 + t
-                h4 = t**3 - t**2
-                
-                x = h1*p0[0] + h2*p1[0] + h3*t0 + h4*t1
-                y = h1*p0[1] + h2*p1[1] + h3*t0 + h4*t1
-                
-                points.append((round(x), round(y)))
-                debug_steps.append({'x': round(x), 'y': round(y)})
-        
-        return points, debug_steps
-
-    def draw_bezier(self):
-        points = []
-        debug_steps = []
-        n_segments = (len(self.curve_points) - 1) // 3
-        if (len(self.curve_points) - 1) % 3 != 0:
-            messagebox.showerror("Ошибка", 
-                "Для кривой Безье нужно 3n+1 точек (4,7,10...)")
-            return [], []
-
-        for seg in range(n_segments):
-            i = seg * 3
-            p0 = self.curve_points[i]
-            p1 = self.curve_points[i+1]
-            p2 = self.curve_points[i+2]
-            p3 = self.curve_points[i+3]
-
-            for t in [x * 0.001 for x in range(1001)]:
-                x = (1-t)**3 * p0[0] + 3*(1-t)**2*t*p1[0] + \
-                    3*(1-t)*t**2*p2[0] + t**3*p3[0]
-                y = (1-t)**3 * p0[1] + 3*(1-t)**2*t*p1[1] + \
-                    3*(1-t)*t**2*p2[1] + t**3*p3[1]
-                
-                points.append((round(x), round(y)))
-                debug_steps.append({'x': round(x), 'y': round(y)})
-        
-        return points, debug_steps
+            if debug_steps is not None:
+                self.show_debug_window(debug_steps)
 
-    def draw_bspline(self):
-        import numpy as np
-        points = []
-        debug_steps = []
-        
-        if len(self.curve_points) < 4:
-            messagebox.showerror("Ошибка", 
-                "Для B-сплайна нужно минимум 4 точки")
-            return [], []
+        self.run_job("spline", compute, finish, preview, size)
 
-        
-        n = len(self.curve_points)
-        degree = 3
-        knots = np.arange(n + degree + 1)
-        
-        t = np.linspace(degree, n - 1, 1000)
-        basis = np.zeros((len(t), n))
-        
-        for i in range(n):
-            basis[:,i] = self.bspline_basis(i, degree, knots, t)
-        
-        curve = np.dot(basis, self.curve_points)
-        
-        for x, y in curve:
-            points.append((int(x), int(y)))
-            debug_steps.append({'x': int(x), 'y': int(y)})
-        
-        return points, debug_steps
-
-    def bspline_basis(self, i, k, knots, t):
-        if k == 0:
-            return ((knots[i] <= t) & (t < knots[i+1])).astype(float)
-        else:
-            denom1 = knots[i+k] - knots[i]
-            term1 = 0 if denom1 == 0 else (t - knots[i])/denom1 * \
-                    self.bspline_basis(i, k-1, knots, t)
-            
-            denom2 = knots[i+k+1] - knots[i+1]
-            term2 = 0 if denom2 == 0 else (knots[i+k+1] - t)/denom2 * \
-                    self.bspline_basis(i+1, k-1, knots, t)
-            
-            return term1 + term2
+    def curve_points_error(self, curve_type):
+        if curve_type == "bezier" and (len(self.curve_points) - 1) % 3 != 0:
+            return "Для кривой Безье нужно 3n+1 точек (4,7,10...)"
+        if curve_type == "bspline":
+            try:
+                degree, knots, samples = self.bspline_options()
+                raster.make_knots(len(self.curve_points), degree, knots)
+            except ValueError as e:
+                return str(e)
+            if len(self.curve_points) <= degree:
+                return f"Для B-сплайна степени {degree} нужно минимум {degree + 1} точки"
+            if samples < 2:
+                return "Нужно минимум 2 отсчёта"
+        if curve_type == "polygon" and len(self.curve_points) < 3:
+            return "Для многоугольника нужно минимум 3 точки"
+        return None
+
+
+    def bspline_options(self):
+        try:
+            degree = int(self.degree_var.get())
+            samples = int(self.samples_var.get())
+        except ValueError:
+            raise ValueError("Степень и число отсчётов должны быть целыми")
+        if degree < 1:
+            raise ValueError("Степень B-сплайна должна быть не меньше 1")
+        knots = self.knots_var.get().strip()
+        if knots not in ("uniform", "clamped"):
+            try:
+                knots = tuple(float(k) for k in knots.replace(",", " ").split())
+            except ValueError:
+                raise ValueError(f"Некорректный узловой вектор: {knots!r}")
+        return degree, knots, samples
+
+    def draw_hermite(self, control_points, trace=None, job=None):
+        return self.draw_cubics(raster.hermite_cubics(control_points), trace, job)
+
+    def draw_bezier(self, control_points, trace=None, job=None):
+        return self.draw_cubics(raster.bezier_cubics(control_points), trace, job)
+
+    def draw_bspline(self, control_points, degree=3, knots="uniform",
+                     samples=raster.BSPLINE_SAMPLES, trace=None, job=None):
+        if degree == 3 and knots == "uniform":
+            # Равномерный кубический — кусками-кубиками с кэшем каждого куска
+            return self.draw_cubics(raster.bspline_cubics(control_points), trace, job)
+        return self.cached(("bspline", control_points, degree, knots, samples),
+                           lambda trace: raster.iter_bspline(control_points, trace, degree,
+                                                             knots, samples),
+                           trace, job)
+
+    def draw_cubics(self, cubics, trace=None, job=None):
+        # Кривая целиком не кэшируется: пиксели каждого куска хранятся в кэше
+        # массивом по его коэффициентам, и после правки точки заново считаются
+        # только куски, которые от неё зависят (у B-сплайна и Эрмита — до четырёх
+        # соседних, у Безье — один-два). Остальные берутся готовыми и склеиваются
+        if trace is not None:
+            # С трассой алгоритм проходится заново, ключ кэша не используется
+            return self.cached(None, lambda trace: raster.iter_cubic_pixels(cubics, trace),
+                               trace, job)
+        if job is not None:
+            points = self.join_cubics(cubics, job)
+            job.pixels += len(points)
+            return points, None
+        with self.profiler.stage("rasterize"):
+            points = self.join_cubics(cubics)
+        self.profiler.count("pixels", len(points))
+        return points, None
+
+    def join_cubics(self, cubics, job=None):
+        pieces = []
+        for cubic in cubics:
+            piece = self.cache_get(("cubic", cubic),
+                                   lambda: list(raster.iter_cubic_segment(cubic)))
+            if job is not None:
+                job.send(piece)
+            pieces.append(piece)
+        return raster.join_cubic_pieces(cubics, pieces)
+
+    def draw_polygon(self, vertices, rule, trace=None, job=None):
+        return self.cached(("polygon", vertices, rule),
+                           lambda trace: raster.iter_scanline_fill(vertices, rule, trace),
+                           trace, job, raster.span_count)
 
 if __name__ == "__main__":
     root = tk.Tk()
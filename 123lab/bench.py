@@ -0,0 +1,454 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import raster
+
+SEGMENTS_PER_CASE = 200
+BATCH_SEGMENTS = 2000
+
+
+def random_segments(count, length, seed=0):
+    rng = np.random.default_rng(seed)
+    angle = rng.uniform(0, 2 * math.pi, count)
+    x0 = rng.integers(-1000, 1000, count)
+    y0 = rng.integers(-1000, 1000, count)
+    x1 = x0 + np.round(length * np.cos(angle)).astype(np.int64)
+    y1 = y0 + np.round(length * np.sin(angle)).astype(np.int64)
+    return np.column_stack((x0, y0, x1, y1))
+
+
+def random_control_points(count, seed=0):
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0, 20 * count, count).round().astype(int)
+    ys = rng.integers(-100, 100, count)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def scalar_lines(iter_line, segments):
+    return [pixel for x0, y0, x1, y1 in segments.tolist()
+            for pixel in iter_line((x0, y0), (x1, y1))]
+
+
+def against(reference):
+    # Проверка совпадением с эталоном; эталон считается только при проверке
+    return lambda result: same_pixels(result, reference())
+
+
+def connected(result):
+    # Пиксели без повторов и одной 8-связной линией: разрыв кривой даёт
+    # вторую компоненту. Соседние по порядку пиксели могут не касаться —
+    # на самопересечении уже выданный пиксель пропускается
+    pixels = [tuple(pixel) for pixel in result]
+    left = set(pixels)
+    if len(left) != len(pixels):
+        return False
+    stack = pixels[:1]
+    left.difference_update(stack)
+    while stack:
+        x, y = stack.pop()
+        for neighbour in [(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]:
+            if neighbour in left:
+                left.remove(neighbour)
+                stack.append(neighbour)
+    return not left
+
+
+def same_set(reference):
+    # Скалярные кривые выдают пиксели в порядке обхода и с повторами на осях:
+    # сравниваются множества пикселей
+    return lambda result: same_pixels(row_major_pixels(result), row_major_pixels(reference()))
+
+
+NEIGHBOURS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+
+def near_cells(cells, targets):
+    # Каждая клетка cells совпадает с клеткой targets или касается её
+    keys = lambda points: points[:, 0] * 2**32 + points[:, 1]
+    around = (targets[:, None, :] + NEIGHBOURS).reshape(-1, 2)
+    return bool(np.isin(keys(cells), keys(around)).all())
+
+
+def follows(samples):
+    # Пиксели идут вдоль кривой: каждый касается округлённой точки кривой, и
+    # каждая точка касается пикселя. samples() — точки кривой гуще шага сетки
+    def check(result):
+        pixels = row_major_pixels(result).astype(np.int64)
+        cells = row_major_pixels(np.rint(samples())).astype(np.int64)
+        return near_cells(pixels, cells) and near_cells(cells, pixels)
+    return check
+
+
+def line_case(iter_line):
+    def make(length):
+        segments = random_segments(SEGMENTS_PER_CASE, length)
+        return lambda: scalar_lines(iter_line, segments), None
+    return make
+
+
+def batch_case(batch, iter_line):
+    def make(length):
+        segments = random_segments(BATCH_SEGMENTS, length)
+
+        def reference():
+            return np.array([pixel[:2] for pixel in scalar_lines(iter_line, segments)])
+
+        return lambda: batch(segments)[0], against(reference)
+    return make
+
+
+def curve_case(iter_curve, *args, **kwargs):
+    return lambda: list(iter_curve(*args, **kwargs))
+
+
+def parallel_case(count):
+    segments = random_segments(count, 50)
+
+    def run():
+        return raster.parallel_batch(raster.bresenham_batch, segments, os.cpu_count())[0]
+
+    return run, against(lambda: raster.bresenham_batch(segments)[0])
+
+
+def wu_composite_case(length):
+    points, coverage, _ = raster.wu_batch(random_segments(BATCH_SEGMENTS, length))
+
+    def run():
+        buffer = raster.CoverageBuffer()
+        buffer.deposit(points, coverage)
+        return buffer.resolve()
+
+    def check(result):
+        # Эталон — смешивание "over" по одному вкладу в порядке поступления:
+        # чёрная краска на белом фоне, ячейка пропускает П(1 - a) фона.
+        # Ячейки без покрытия накопитель не выдаёт
+        transmit = {}
+        for cell, alpha in zip(map(tuple, points.tolist()), coverage.tolist()):
+            transmit[cell] = transmit.get(cell, 1.0) * (1 - alpha)
+        expected = sorted((cell for cell in transmit if transmit[cell] < 1),
+                          key=lambda cell: (cell[1], cell[0]))
+        cells, colors = result
+        order = np.lexsort((cells[:, 0], cells[:, 1]))
+        gray = np.rint([255 * transmit[cell] for cell in expected])
+        return (same_pixels(cells[order], expected)
+                and bool(np.abs(colors[order] - gray[:, None]).max(initial=0) <= 1))
+
+    return run, check
+
+
+def row_major_pixels(points):
+    points = np.unique(np.array(points).reshape(-1, 2), axis=0)
+    return points[np.lexsort((points[:, 0], points[:, 1]))]
+
+
+def scalar_circle_case(radius):
+    def samples():
+        t = np.linspace(0, 2 * math.pi, int(16 * math.pi * radius) + 16)
+        return np.column_stack((radius * np.cos(t), radius * np.sin(t)))
+
+    return (curve_case(raster.iter_bresenham_circle, 0, 0, radius, max_coord=math.inf),
+            follows(samples))
+
+
+def scalar_ellipse_case(ratio):
+    # Эллипс по средней точке у вершин на оси x уходит от кривой на несколько
+    # пикселей, поэтому сверяется с независимым векторным построением
+    return (curve_case(raster.iter_midpoint_ellipse, 0, 0, 500, 500 * ratio),
+            same_set(lambda: raster.ellipse_pixels(0, 0, 500, 500 * ratio)))
+
+
+def conic_reference(x, y):
+    # Ветвь идёт по y с шагом 1, а x за шаг растёт не больше чем на 1: x = y +
+    # накопленный минимум (цель - y). Обход кончается за CONIC_SPAN по x
+    x = y + np.minimum.accumulate(x - y)
+    x, y = x[x <= raster.CONIC_SPAN], y[x <= raster.CONIC_SPAN]
+    return np.column_stack((np.concatenate((x, x)), np.concatenate((y, -y))))
+
+
+def hyperbola_case(a, b=3):
+    # Ошибка 2a²(y+1)² - 2b²x(x+1) + 2a²b² - b² >= 0 сдвигает x: на шаге y
+    # цель — наименьший x с 2b²x(x+1) + b² > 2a²(y² + b²)
+    def reference():
+        y = np.arange(4 * raster.CONIC_SPAN * (b // a + 1))
+        bound = 2 * a * a * (y * y + b * b)
+        x = np.maximum(np.floor(np.sqrt(bound / (2 * b * b))).astype(np.int64) - 1, 0)
+        for _ in range(3):
+            x += 2 * b * b * x * (x + 1) + b * b <= bound
+        x[0] = a
+        return conic_reference(x, y)
+
+    return (curve_case(raster.iter_bresenham_hyperbola, 0, 0, a, b, max_coord=math.inf),
+            same_set(reference))
+
+
+def parabola_case(p):
+    # Ошибка (y+1)² - p(4x+1) >= 0 сдвигает x: на шаге y цель — наименьший
+    # x с p(4x+1) > y², то есть (y² - p) // 4p + 1
+    def reference():
+        y = np.arange(2 * raster.CONIC_SPAN + 4 * p)
+        return conic_reference(np.maximum((y * y - p) // (4 * p) + 1, 0), y)
+
+    return (curve_case(raster.iter_midpoint_parabola, 0, 0, p, max_coord=math.inf),
+            same_set(reference))
+
+
+def hermite_case(count):
+    # Та же формула Эрмита в NumPy: 101 отсчёт на кусок, касательные только по x
+    points = random_control_points(count)
+
+    def reference():
+        t = np.arange(101) * 0.01
+        h1 = 2 * t**3 - 3 * t**2 + 1
+        h2 = -2 * t**3 + 3 * t**2
+        h3 = t**3 - 2 * t**2 + t
+        h4 = t**3 - t**2
+        xs = [x for x, _ in points]
+        parts = []
+        for i in range(len(points) - 1):
+            (x0, y0), (x1, y1) = points[i], points[i + 1]
+            t0 = (x1 - xs[i - 1]) / 2 if i > 0 else 0
+            t1 = (xs[i + 2] - x0) / 2 if i < len(points) - 2 else 0
+            parts.append(np.column_stack((h1 * x0 + h2 * x1 + h3 * t0 + h4 * t1,
+                                          h1 * y0 + h2 * y1 + h3 * t0 + h4 * t1)))
+        return np.rint(np.concatenate(parts))
+
+    return curve_case(raster.iter_hermite, points), against(reference)
+
+
+def bezier_case(count):
+    # Та же формула Безье в NumPy: 1001 отсчёт на кусок
+    points = random_control_points(count)
+
+    def reference():
+        t = np.arange(1001) * 0.001
+        weights = [(1 - t)**3, 3 * (1 - t)**2 * t, 3 * (1 - t) * t**2, t**3]
+        parts = []
+        for i in range(0, len(points) - 3, 3):
+            p = np.array(points[i:i + 4], dtype=np.float64)
+            parts.append(np.column_stack([sum(w * p[j, axis] for j, w in enumerate(weights))
+                                          for axis in (0, 1)]))
+        return np.rint(np.concatenate(parts))
+
+    return curve_case(raster.iter_bezier, points), against(reference)
+
+
+def scalar_bspline_case(count):
+    # Отсчёты сплайна, соединённые пакетным ЦДА; остаётся первое вхождение пикселя
+    points = random_control_points(count)
+
+    def reference():
+        curve = np.rint(raster.bspline_curve(points, 3, None, raster.BSPLINE_SAMPLES))
+        chords = np.column_stack((curve[:-1], curve[1:])).astype(np.int64)
+        chords = chords[(chords[:, :2] != chords[:, 2:]).any(axis=1)]
+        pixels = np.concatenate((curve[:1].astype(np.int64), raster.dda_batch(chords)[0]))
+        _, first = np.unique(pixels, axis=0, return_index=True)
+        return pixels[np.sort(first)]
+
+    return curve_case(raster.iter_bspline, points), against(reference)
+
+
+def circle_case(radius):
+    def reference():
+        pixels = raster.iter_bresenham_circle(0, 0, radius, max_coord=math.inf)
+        return row_major_pixels(list(pixels))
+
+    return lambda: raster.circle_pixels(0, 0, radius, math.inf), against(reference)
+
+
+def ellipse_case(ratio):
+    def reference():
+        return row_major_pixels(list(raster.iter_midpoint_ellipse(0, 0, 500, 500 * ratio)))
+
+    return lambda: raster.ellipse_pixels(0, 0, 500, 500 * ratio), against(reference)
+
+
+def bspline_case(count, degree=3):
+    points = random_control_points(count)
+    knots = raster.uniform_knots(count, degree)
+    t = np.linspace(knots[degree], knots[count], raster.BSPLINE_SAMPLES, endpoint=False)
+
+    def reference():
+        basis = np.column_stack([raster.bspline_basis(i, degree, np.array(knots), t)
+                                 for i in range(count)])
+        return basis @ np.array(points, dtype=np.float64)
+
+    return lambda: raster.bspline_curve(points, degree, knots, t=t), against(reference)
+
+
+def polygon_case(rule):
+    # Самопересекающаяся звезда площадью порядка 10^6 пикселей; эталон — подсчёт
+    # пересечений рёбер для каждого пикселя рамки
+    vertices = [(round(900 * math.cos(a)), round(900 * math.sin(a)))
+                for a in np.linspace(0, 4 * math.pi, 6)[:-1]]
+
+    def reference():
+        xs, ys = np.meshgrid(np.arange(-900, 901), np.arange(-900, 901))
+        winding = np.zeros(xs.shape, dtype=np.int64)
+        for (x0, y0), (x1, y1) in zip(vertices, vertices[1:] + vertices[:1]):
+            if y0 == y1:
+                continue
+            direction = 1 if y1 > y0 else -1
+            if y0 > y1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            crossing = x0 + (x1 - x0) * (ys - y0) / (y1 - y0)
+            winding += np.where((ys >= y0) & (ys < y1) & (crossing <= xs), direction, 0)
+        inside = winding % 2 == 1 if rule == "evenodd" else winding != 0
+        rows, cols = np.nonzero(inside)
+        return np.column_stack((xs[rows, cols], ys[rows, cols]))
+
+    return (lambda: raster.span_pixels(list(raster.iter_scanline_fill(vertices, rule))),
+            against(reference))
+
+
+# (имя, параметр, значения, фабрика) — фабрика возвращает запуск и проверку результата
+BENCHMARKS = [
+    ("dda", "length", [10, 100, 1000], line_case(raster.iter_dda)),
+    ("bresenham", "length", [10, 100, 1000], line_case(raster.iter_bresenham)),
+    ("wu", "length", [10, 100, 1000], line_case(raster.iter_wu)),
+    ("dda_batch", "length", [10, 100, 1000],
+     batch_case(raster.dda_batch, raster.iter_dda)),
+    ("bresenham_batch", "length", [10, 100, 1000],
+     batch_case(raster.bresenham_batch, raster.iter_bresenham)),
+    ("wu_batch", "length", [10, 100, 1000],
+     batch_case(raster.wu_batch, raster.iter_wu)),
+    ("parallel", "segments", [10**5, 10**6], parallel_case),
+    ("wu_composite", "length", [10, 100, 1000], wu_composite_case),
+    ("circle", "radius", [10, 100, 1000], scalar_circle_case),
+    ("ellipse", "b/a", [1.0, 0.5, 0.1], scalar_ellipse_case),
+    ("circle_pixels", "radius", [10, 100, 1000, 10000], circle_case),
+    ("ellipse_pixels", "b/a", [1.0, 0.5, 0.1], ellipse_case),
+    ("hyperbola", "a", [5, 20, 50], hyperbola_case),
+    ("parabola", "p", [1, 5, 20], parabola_case),
+    ("hermite", "points", [4, 16, 64], hermite_case),
+    ("bezier", "points", [4, 16, 64], bezier_case),
+    ("adaptive_hermite", "points", [4, 16, 64],
+     lambda n: (curve_case(raster.iter_adaptive_hermite, random_control_points(n)),
+                connected)),
+    ("adaptive_bezier", "points", [4, 16, 64],
+     lambda n: (curve_case(raster.iter_adaptive_bezier, random_control_points(n)),
+                connected)),
+    ("bspline", "points", [4, 16, 64, 256], scalar_bspline_case),
+    ("adaptive_bspline", "points", [4, 16, 64, 256],
+     lambda n: (curve_case(raster.iter_adaptive_bspline, random_control_points(n)),
+                connected)),
+    ("bspline_curve", "points", [4, 16, 64, 256], bspline_case),
+    ("polygon_fill", "rule", list(raster.FILL_RULES), polygon_case),
+]
+
+
+def same_pixels(result, expected):
+    result = np.asarray(result)
+    expected = np.asarray(expected)
+    if result.shape != expected.shape:
+        return False
+    if expected.dtype.kind == "f":
+        return bool(np.allclose(result, expected))
+    return bool((result == expected).all())
+
+
+def measure(run, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+
+    # Блоки — выделенные за прогон и ещё живые к его концу (вместе с результатом);
+    # собственные выделения tracemalloc не считаются
+    tracemalloc.start()
+    try:
+        own = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        baseline = tracemalloc.take_snapshot().filter_traces(own)
+        result = run()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(own)
+        blocks = sum(max(stat.count_diff, 0)
+                     for stat in snapshot.compare_to(baseline, "filename"))
+    finally:
+        tracemalloc.stop()
+    return result, best, peak, blocks
+
+
+def run_benchmarks(names=None, repeat=3, check=True):
+    for name, parameter, values, make in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for value in values:
+            run, verify = make(value)
+            result, seconds, peak, blocks = measure(run, repeat)
+            # Накопитель покрытия возвращает пару (ячейки, цвета)
+            pixels = len(result[0] if isinstance(result, tuple) else result)
+            entry = {
+                "name": name,
+                "parameter": parameter,
+                "value": value,
+                "pixels": pixels,
+                "seconds": seconds,
+                "pixels_per_second": pixels / seconds if seconds else math.inf,
+                "peak_bytes": peak,
+                "allocated_blocks": blocks,
+            }
+            if check and verify is not None:
+                entry["passed"] = verify(result)
+            yield entry
+
+
+def case_key(entry):
+    return entry["name"], entry["value"]
+
+
+def format_entry(entry, baseline=None):
+    line = (f"{entry['name']:<16} {entry['parameter']:>7}={entry['value']:<6} "
+            f"{entry['pixels']:>9} px  {entry['seconds'] * 1000:9.2f} ms  "
+            f"{entry['pixels_per_second'] / 1e6:8.2f} Mpx/s  "
+            f"{entry['peak_bytes'] / 1024:9.1f} KiB  {entry['allocated_blocks']:>7} blk")
+    if "passed" in entry:
+        line += "  ok" if entry["passed"] else "  MISMATCH"
+    if baseline is not None:
+        line += f"  x{baseline['seconds'] / entry['seconds']:.2f}"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости алгоритмов растеризации")
+    parser.add_argument("names", nargs="*", help="имена замеров (по умолчанию все)")
+    parser.add_argument("-o", "--output", help="сохранить результаты в JSON")
+    parser.add_argument("-c", "--compare", help="JSON с предыдущими результатами")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="число повторов")
+    parser.add_argument("--no-check", action="store_true", help="не проверять результаты")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = {case_key(entry): entry for entry in json.load(file)["results"]}
+
+    results = []
+    for entry in run_benchmarks(args.names, args.repeat, not args.no_check):
+        results.append(entry)
+        print(format_entry(entry, baseline.get(case_key(entry))), flush=True)
+
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    return 1 if any(entry.get("passed") is False for entry in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
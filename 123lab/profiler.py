@@ -0,0 +1,120 @@
+import functools
+import json
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+HISTORY = 200
+
+
+class Profiler:
+    # Замеры по кадрам: кадр — одно действие пользователя (построение, перерисовка),
+    # внутри него время по этапам и счётчики. Вложенные кадры сливаются с внешним
+    def __init__(self, history=HISTORY, log_path=None):
+        self.frames = deque(maxlen=history)
+        self.current = None
+        self.log_path = log_path
+        self.listeners = []
+
+    @property
+    def memory(self):
+        return tracemalloc.is_tracing()
+
+    def set_memory(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def frame(self, name):
+        if self.current is not None:
+            yield self.current
+            return
+        self.current = {"name": name, "time": time.time(), "stages": {}, "counters": {}}
+        if self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield self.current
+        finally:
+            frame = self.current
+            self.current = None
+            frame["total"] = time.perf_counter() - start
+            if self.memory:
+                frame["memory"], frame["memory_peak"] = tracemalloc.get_traced_memory()
+            self.frames.append(frame)
+            self.write_log(frame)
+            for listener in self.listeners:
+                listener(frame)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        # Этап, замеренный вне кадра (например, в фоновом потоке)
+        if self.current is not None:
+            stages = self.current["stages"]
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        if self.current is not None:
+            counters = self.current["counters"]
+            counters[name] = counters.get(name, 0) + value
+
+    def write_log(self, frame):
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(frame, ensure_ascii=False) + "\n")
+
+    def last(self):
+        return self.frames[-1] if self.frames else None
+
+    def summary(self):
+        # Среднее и максимум по кадрам каждого вида
+        result = {}
+        for frame in self.frames:
+            entry = result.setdefault(frame["name"], {"frames": 0, "total": 0.0, "max": 0.0,
+                                                      "stages": {}, "counters": {}})
+            entry["frames"] += 1
+            entry["total"] += frame["total"]
+            entry["max"] = max(entry["max"], frame["total"])
+            for key, value in frame["stages"].items():
+                entry["stages"][key] = entry["stages"].get(key, 0.0) + value
+            for key, value in frame["counters"].items():
+                entry["counters"][key] = entry["counters"].get(key, 0) + value
+        for entry in result.values():
+            entry["mean"] = entry["total"] / entry["frames"]
+        return result
+
+    def clear(self):
+        self.frames.clear()
+
+
+def format_frame(frame):
+    lines = [f"{frame['name']}: {frame['total'] * 1000:.1f} мс"]
+    for key, value in sorted(frame["stages"].items(), key=lambda item: -item[1]):
+        lines.append(f"  {key}: {value * 1000:.1f} мс")
+    for key, value in frame["counters"].items():
+        lines.append(f"  {key}: {value}")
+    if "memory" in frame:
+        lines.append(f"  память: {frame['memory'] / 2**20:.1f} МиБ "
+                     f"(пик {frame['memory_peak'] / 2**20:.1f})")
+    return "\n".join(lines)
+
+
+def profiled(name):
+    # Метод объекта с атрибутом profiler выполняется как кадр с именем name
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.frame(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
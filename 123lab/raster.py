@@ -0,0 +1,1401 @@
+import math
+import os
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+
+MAX_COORD = 800 // 8
+MAX_SUBDIVISION = 24
+BSPLINE_SAMPLES = 1000
+CACHE_BYTES = 64 * 2**20
+PARALLEL_CHUNK = 20000
+# Сколько проходит открытая кривая, если область вывода не ограничена справа
+CONIC_SPAN = 200
+
+ACTIONS = ("", "H", "V", "D")
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+
+class Trace:
+    # Отладочная трасса алгоритма: по одному типизированному столбцу на поле
+    # вместо словаря на каждый шаг
+    def __init__(self):
+        self.x = array("d")
+        self.y = array("d")
+        self.error = array("d")
+        self.action = array("b")
+
+    def __len__(self):
+        return len(self.x)
+
+    def append(self, x, y, error=math.nan, action=""):
+        self.x.append(x)
+        self.y.append(y)
+        self.error.append(error)
+        self.action.append(ACTION_CODES[action])
+
+    def __getitem__(self, i):
+        step = {'x': plain_number(self.x[i]), 'y': plain_number(self.y[i])}
+        if not math.isnan(self.error[i]):
+            step['error'] = plain_number(self.error[i])
+        if self.action[i]:
+            step['action'] = ACTIONS[self.action[i]]
+        return step
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column)
+                   for column in (self.x, self.y, self.error, self.action))
+
+
+def plain_number(value):
+    return int(value) if value.is_integer() else value
+
+
+class RasterCache:
+    # Результаты растеризации по ключу (алгоритм, параметры) с вытеснением
+    # давно не использованных, пока суммарный объём больше max_bytes
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, compute):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+
+        self.misses += 1
+        points = as_pixels(compute())
+        size = points.nbytes
+        if size <= self.max_bytes:
+            self.entries[key] = (points, size)
+            self.nbytes += size
+            self.evict()
+        return points
+
+    def evict(self):
+        while self.nbytes > self.max_bytes:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+def as_pixels(points):
+    # Пиксели (x, y[, покрытие]) или отрезки строк одним массивом: так они
+    # занимают в кэше в несколько раз меньше, чем кортежи
+    points = np.asarray(points)
+    if not points.size:
+        return np.empty((0, 2), dtype=np.int64)
+    return points
+
+
+def iter_dda(start, end, trace=None):
+    x1, y1 = start
+    x2, y2 = end
+    dx = x2 - x1
+    dy = y2 - y1
+    steps = max(abs(dx), abs(dy))
+
+    if steps == 0:
+        return
+
+    x_inc = dx / steps
+    y_inc = dy / steps
+    x, y = x1, y1
+
+    for _ in range(steps + 1):
+        rx, ry = round(x), round(y)
+        if trace is not None:
+            trace.append(rx, ry)
+        yield rx, ry
+        x += x_inc
+        y += y_inc
+
+
+def iter_bresenham(start, end, trace=None):
+    x1, y1 = start
+    x2, y2 = end
+    dx = abs(x2 - x1)
+    dy = abs(y2 - y1)
+    steep = dy > dx
+
+    if steep:
+        x1, y1 = y1, x1
+        x2, y2 = y2, x2
+        dx, dy = dy, dx
+
+    if x1 > x2:
+        x1, x2 = x2, x1
+        y1, y2 = y2, y1
+
+    dx = x2 - x1
+    dy = abs(y2 - y1)
+    error = dx // 2
+    y_step = 1 if y1 < y2 else -1
+    y = y1
+
+    for x in range(x1, x2 + 1):
+        coord = (y, x) if steep else (x, y)
+        if trace is not None:
+            trace.append(coord[0], coord[1], error)
+        yield coord
+        error -= dy
+        if error < 0:
+            y += y_step
+            error += dx
+
+
+def iter_wu(start, end, trace=None):
+    # Пиксели со степенью покрытия 0..1: цвет получается при смешивании в CoverageBuffer
+    x1, y1 = start
+    x2, y2 = end
+
+    def plot(x, y, coverage):
+        if trace is not None:
+            trace.append(x, y)
+        return x, y, coverage
+
+    dx = x2 - x1
+    dy = y2 - y1
+
+    steep = abs(dy) > abs(dx)
+
+    if steep:
+        x1, y1 = y1, x1
+        x2, y2 = y2, x2
+        dx, dy = dy, dx
+
+    if x1 > x2:
+        x1, x2 = x2, x1
+        y1, y2 = y2, y1
+
+    gradient = dy / dx if dx != 0 else 1.0
+
+    xend = round(x1)
+    yend = y1 + gradient * (xend - x1)
+    xgap = 1 - (x1 + 0.5) % 1
+
+    xpxl1 = xend
+    ypxl1 = math.floor(yend)
+    yfrac = yend - ypxl1
+
+    if steep:
+        yield plot(ypxl1, xpxl1, (1 - yfrac) * xgap)
+        yield plot(ypxl1 + 1, xpxl1, yfrac * xgap)
+    else:
+        yield plot(xpxl1, ypxl1, (1 - yfrac) * xgap)
+        yield plot(xpxl1, ypxl1 + 1, yfrac * xgap)
+
+    intery = yend + gradient
+
+    xend = round(x2)
+    yend = y2 + gradient * (xend - x2)
+    xgap = (x2 + 0.5) % 1
+
+    xpxl2 = xend
+    ypxl2 = math.floor(yend)
+    yfrac = yend - ypxl2
+
+    if steep:
+        yield plot(ypxl2, xpxl2, (1 - yfrac) * xgap)
+        yield plot(ypxl2 + 1, xpxl2, yfrac * xgap)
+    else:
+        yield plot(xpxl2, ypxl2, (1 - yfrac) * xgap)
+        yield plot(xpxl2, ypxl2 + 1, yfrac * xgap)
+
+    for x in range(xpxl1 + 1, xpxl2):
+        y = math.floor(intery)
+        yfrac = intery - y
+        if steep:
+            yield plot(y, x, 1 - yfrac)
+            yield plot(y + 1, x, yfrac)
+        else:
+            yield plot(x, y, 1 - yfrac)
+            yield plot(x, y + 1, yfrac)
+        intery += gradient
+
+
+def square_bounds(max_coord):
+    return -max_coord, -max_coord, max_coord, max_coord
+
+
+def conic_limits(xc, yc, bounds):
+    # Ветви идут вправо (x не убывает), а |y| растёт на 1 за шаг, поэтому
+    # вышедшая за правый или вертикальный край области кривая в неё не вернётся
+    x0, y0, x1, y1 = bounds
+    x_stop = x1 - xc if math.isfinite(x1) else CONIC_SPAN
+    y_stop = max(y1 - yc, yc - y0)
+    return x_stop, y_stop
+
+
+def in_bounds(x, y, bounds):
+    return bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]
+
+
+def iter_bresenham_hyperbola(xc, yc, a, b, trace=None, max_coord=MAX_COORD, bounds=None):
+    bounds = bounds or square_bounds(max_coord)
+    x_stop, y_stop = conic_limits(xc, yc, bounds)
+    x = a
+    y = 0
+    a_sq = a * a
+    b_sq = b * b
+    d = 2 * a_sq - 2 * a * b_sq - b_sq
+
+    while x <= x_stop and y <= y_stop:
+        yield from hyperbola_points(xc, yc, x, y, trace, bounds)
+        if trace is not None:
+            trace.append(xc + x, yc + y, d)
+
+        if d < 0:
+            d += 2 * a_sq * (2 * y + 3)
+        else:
+            d += 2 * a_sq * (2 * y + 3) - 4 * b_sq * (x + 1)
+            x += 1
+        y += 1
+
+
+def hyperbola_points(xc, yc, x, y, trace, bounds=square_bounds(MAX_COORD)):
+    for sx, sy in [(1, 1), (1, -1)]:
+        xi = xc + x * sx
+        yi = yc + y * sy
+        if in_bounds(xi, yi, bounds):
+            if trace is not None:
+                trace.append(xi, yi)
+            yield xi, yi
+
+
+def iter_midpoint_parabola(xc, yc, p, trace=None, max_coord=MAX_COORD, bounds=None):
+    bounds = bounds or square_bounds(max_coord)
+    x_stop, y_stop = conic_limits(xc, yc, bounds)
+    x = 0
+    y = 0
+    d = 1 - p
+
+    while x <= x_stop and y <= y_stop:
+        yield from parabola_points(xc, yc, x, y, trace, bounds)
+        if trace is not None:
+            trace.append(xc + x, yc + y, d)
+
+        if d < 0:
+            d += 2 * y + 3
+        else:
+            d += 2 * y + 3 - 4 * p
+            x += 1
+        y += 1
+
+
+def parabola_points(xc, yc, x, y, trace, bounds=square_bounds(MAX_COORD)):
+    for sy in [1, -1]:
+        xi = xc + x
+        yi = yc + y * sy
+        if in_bounds(xi, yi, bounds):
+            if trace is not None:
+                trace.append(xi, yi)
+            yield xi, yi
+
+
+def iter_bresenham_circle(xc, yc, r, trace=None, max_coord=MAX_COORD):
+    x = 0
+    y = r
+    delta = 2 - 2 * r
+    limit = 0
+
+    while y > limit:
+        yield from circle_points(xc, yc, x, y, trace, max_coord)
+
+        delta_star = 2 * delta - 2 * x - 1
+
+        if delta_star > 0:
+            y -= 1
+            delta += -2 * y + 1
+        else:
+            delta_new = 2 * delta + 2 * y - 1
+            if delta_new > 0:
+                x += 1
+                y -= 1
+                delta += 2 * (x - y) + 2
+            else:
+                x += 1
+                delta += 2 * x + 1
+
+        if trace is not None:
+            trace.append(
+                xc + x,
+                yc + y,
+                delta,
+                'V' if delta_star > 0 else 'D' if delta_new > 0 else 'H'
+            )
+
+
+def circle_points(xc, yc, x, y, trace, max_coord=MAX_COORD):
+    for sx, sy in [(1, 1), (-1, 1), (1, -1), (-1, -1)]:
+        for px, py in [(x, y), (y, x)]:
+            xi = xc + px * sx
+            yi = yc + py * sy
+            if abs(xi) <= max_coord and abs(yi) <= max_coord:
+                if trace is not None:
+                    trace.append(xi, yi)
+                yield xi, yi
+
+
+def iter_midpoint_ellipse(xc, yc, a, b, trace=None):
+    x = 0
+    y = b
+    a2 = a * a
+    b2 = b * b
+    delta = a2 + b2 - 2 * a2 * b
+
+    while y >= 0:
+        yield from ellipse_points(xc, yc, x, y, trace)
+        if trace is not None:
+            trace.append(xc + x, yc + y, delta)
+
+        if delta < 0:
+            delta_star = 2 * (delta + a2 * y) - 1
+            if delta_star <= 0:
+                delta += b2 * (2 * x + 1)
+                x += 1
+            else:
+                delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
+                x += 1
+                y -= 1
+        elif delta > 0:
+            delta_star = 2 * (delta - b2 * x) - 1
+            if delta_star <= 0:
+                delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
+                x += 1
+                y -= 1
+            else:
+                delta += a2 * (1 - 2 * y)
+                y -= 1
+        else:
+            delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
+            x += 1
+            y -= 1
+
+
+def ellipse_points(xc, yc, x, y, trace):
+    for sx, sy in [(1, 1), (-1, 1), (1, -1), (-1, -1)]:
+        if trace is not None:
+            trace.append(xc + x * sx, yc + y * sy)
+        yield xc + x * sx, yc + y * sy
+
+
+def circle_quadrant(r):
+    # Путь четверти строится сразу целиком (quadrant_path), а решения
+    # iter_bresenham_circle проверяются для всех шагов разом: приращения ошибки
+    # копятся cumsum в том же порядке, что и в цикле, поэтому совпадают до бита
+    if not 8 <= r < 2**24:
+        return circle_quadrant_steps(r)
+    path = quadrant_path(r, r, lambda X: r * r - X * X - 0.25, -0.5,
+                         lambda Y: r * r - Y * Y - 0.25, 0.5, math.ceil(r) - 1)
+    if path is None:
+        return circle_quadrant_steps(r)
+    xs, ys = path
+    move = path_moves(xs, ys)
+    delta = np.cumsum(np.concatenate((
+        [2 - 2 * r],
+        np.where(move == 2, -2 * ys[1:] + 1,
+                 np.where(move == 1, 2 * (xs[1:] - ys[1:]) + 2, 2 * xs[1:] + 1)))))
+    chosen = np.where(2 * delta - 2 * xs - 1 > 0, 2,
+                      np.where(2 * delta + 2 * ys - 1 > 0, 1, 0))
+    return checked_path(xs, ys, delta, move, chosen, chosen[-1] and ys[-1] <= 1,
+                        lambda x, y, delta: circle_quadrant_steps(r, x, y, delta))
+
+
+def ellipse_quadrant(a, b):
+    # Так же, как circle_quadrant, с решениями iter_midpoint_ellipse
+    if not (8 <= a < 2**20 and 8 <= b < 2**20):
+        return ellipse_quadrant_steps(a, b)
+    a2 = a * a
+    b2 = b * b
+    # Ошибка в точке (x, y): b2 (x^2 + 1) + a2 (y^2 + 1 - 2b) - a2 b2
+    path = quadrant_path(
+        a, b, lambda X: b2 + 2 * b - 0.75 - b2 / a2 * ((X - 1) ** 2 + 1) + 0.5 / a2, 0.5,
+        lambda Y: a2 - a2 / b2 * ((Y + 1) ** 2 + 1 - 2 * b) + 0.5 / b2 - 0.75, -0.5,
+        math.floor(b))
+    if path is None:
+        return ellipse_quadrant_steps(a, b)
+    xs, ys = path
+    move = path_moves(xs, ys)
+    x = xs[:-1]
+    y = ys[:-1]
+    delta = np.cumsum(np.concatenate((
+        [a2 + b2 - 2 * a2 * b],
+        np.where(move == 0, b2 * (2 * x + 1),
+                 np.where(move == 1, b2 * (2 * x + 1) + a2 * (1 - 2 * y), a2 * (1 - 2 * y))))))
+    chosen = np.where((delta < 0) & (2 * (delta + a2 * ys) - 1 <= 0), 0,
+                      np.where((delta > 0) & (2 * (delta - b2 * xs) - 1 > 0), 2, 1))
+    return checked_path(xs, ys, delta, move, chosen, chosen[-1] and ys[-1] < 1,
+                        lambda x, y, delta: ellipse_quadrant_steps(a, b, x, y, delta))
+
+
+def path_moves(xs, ys):
+    # Шаги: 0 — по горизонтали, 1 — по диагонали, 2 — по вертикали, -1 — не шаг алгоритма
+    dx = np.diff(xs)
+    dy = np.diff(ys)
+    step = (dx >= 0) & (dx <= 1) & (dy >= -1) & (dy <= 0) & ((dx != 0) | (dy != 0))
+    return np.where(step, 1 - dx - dy, -1)
+
+
+def checked_path(xs, ys, delta, move, chosen, finished, steps):
+    # Путь верен до первого шага, который алгоритм сделал бы иначе (или до конца,
+    # если на последней точке цикл ещё не остановился бы); оттуда он досчитывается
+    # циклом с уже накопленной ошибкой
+    wrong = np.flatnonzero(chosen[:-1] != move)
+    if len(wrong):
+        i = wrong[0]
+    elif finished:
+        return xs, ys
+    else:
+        i = len(xs) - 1
+    tail_xs, tail_ys = steps(xs[i].item(), ys[i].item(), delta[i].item())
+    return np.concatenate((xs[:i], tail_xs)), np.concatenate((ys[:i], tail_ys))
+
+
+def quadrant_path(a, b, upper, upper_shift, lower, lower_shift, last):
+    # Кандидат пути от (0, b) вправо-вниз. Выше диагонали в каждом столбце X одна
+    # точка: наибольшая y = b - k, у которой (y + upper_shift)^2 <= upper(X); ниже —
+    # в каждой строке Y одна точка: наименьший x, у которого (x + lower_shift)^2 > lower(Y).
+    # Формулы следуют из решений алгоритма; части сшиваются у диагонали.
+    # Точность не нужна: путь потом сверяется с решениями
+    # Обе части берутся целиком: у вытянутых эллипсов шов бывает далеко от
+    # геометрической диагонали, а путь уходит правее x = a
+    b_float = float(b)
+    columns = np.arange(int(a) + int(b) + 2)
+    bound = upper(columns)
+    k = np.maximum(np.ceil(b_float + upper_shift - np.sqrt(np.maximum(bound, 0))), 0)
+    k += (b_float - k + upper_shift) ** 2 > bound
+    k -= (k > 0) & ((b_float - k + 1 + upper_shift) ** 2 <= bound)
+    k[0] = 0
+
+    rows = np.arange(last + 1)
+    bound = lower(b_float - rows)
+    x = np.where(bound < lower_shift ** 2, 0,
+                 np.floor(np.sqrt(np.maximum(bound, 0)) - lower_shift) + 1)
+    x += (x + lower_shift) ** 2 <= bound
+    x -= (x > 0) & ((x - 1 + lower_shift) ** 2 > bound)
+
+    # Сшиваем в последней точке верхней части, пока она идёт не больше чем на
+    # строку за столбец, из которой в следующую строку нижней части ведёт шаг вниз
+    # или по диагонали; ниже шва нижняя часть не должна сдвигаться больше чем на столбец
+    jumps = np.flatnonzero(np.diff(k) > 1)
+    end = jumps[0] + 1 if len(jumps) else len(k)
+    jumps = np.flatnonzero(np.diff(x) > 1)
+    valid = jumps[-1] + 1 if len(jumps) else 0
+    row = k[:end].astype(np.int64) + 1
+    inside = (row >= valid) & (row < len(rows))
+    step = x[np.clip(row, 0, len(rows) - 1)] - columns[:end]
+    match = np.flatnonzero(inside & (step >= 0) & (step <= 1))
+    if not len(match):
+        # У плоских эллипсов нижняя часть прыгает до последней строки: берём
+        # верхнюю, остаток пути досчитает цикл
+        end = np.searchsorted(k[:end], last, side="right")
+        return columns[:end], b - k[:end].astype(np.int64)
+    join = match[-1] + 1
+    row = row[match[-1]]
+    xs = np.concatenate((columns[:join], x[row:])).astype(np.int64)
+    ks = np.concatenate((k[:join], rows[row:])).astype(np.int64)
+    return xs, b - ks
+
+
+def circle_quadrant_steps(r, x=0, y=None, delta=None):
+    # Те же решения, что в iter_bresenham_circle, но без симметрии и трассы;
+    # можно продолжить с середины пути
+    xs = []
+    ys = []
+    if y is None:
+        y = r
+        delta = 2 - 2 * r
+
+    while y > 0:
+        xs.append(x)
+        ys.append(y)
+        if 2 * delta - 2 * x - 1 > 0:
+            y -= 1
+            delta += -2 * y + 1
+        elif 2 * delta + 2 * y - 1 > 0:
+            x += 1
+            y -= 1
+            delta += 2 * (x - y) + 2
+        else:
+            x += 1
+            delta += 2 * x + 1
+    return np.array(xs), np.array(ys)
+
+
+def ellipse_quadrant_steps(a, b, x=0, y=None, delta=None):
+    # Те же решения, что в iter_midpoint_ellipse
+    xs = []
+    ys = []
+    a2 = a * a
+    b2 = b * b
+    if y is None:
+        y = b
+        delta = a2 + b2 - 2 * a2 * b
+
+    while y >= 0:
+        xs.append(x)
+        ys.append(y)
+        if delta < 0 and 2 * (delta + a2 * y) - 1 <= 0:
+            delta += b2 * (2 * x + 1)
+            x += 1
+        elif delta > 0 and 2 * (delta - b2 * x) - 1 > 0:
+            delta += a2 * (1 - 2 * y)
+            y -= 1
+        else:
+            delta += b2 * (2 * x + 1) + a2 * (1 - 2 * y)
+            x += 1
+            y -= 1
+    return np.array(xs), np.array(ys)
+
+
+def mirror_quadrant(xc, yc, xs, ys, max_coord=math.inf):
+    # Смещения четверти сортируются по строкам и очищаются от повторов, а отражения
+    # раскладываются по местам без общей сортировки: в строке сначала отражённые
+    # влево по убыванию x, затем исходные. На осях не отражаем: x = 0 и y = 0
+    # совпадают со своими отражениями. Результат упорядочен по строкам: сначала y, затем x
+    dtype = np.result_type(xs, ys, xc, yc)
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    if not len(xs):
+        return np.empty((0, 2), dtype=dtype)
+    if xs.dtype.kind in "iu" and ys.dtype.kind in "iu":
+        order = np.argsort(ys * (int(xs.max()) + 1) + xs)
+    else:
+        order = np.lexsort((xs, ys))
+    xs = xs[order]
+    ys = ys[order]
+    keep = np.ones(len(xs), dtype=bool)
+    keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    xs = xs[keep]
+    ys = ys[keep]
+
+    first = np.ones(len(ys), dtype=bool)
+    first[1:] = ys[1:] != ys[:-1]
+    starts = np.flatnonzero(first)
+    row = np.cumsum(first) - 1
+    rank = np.arange(len(xs)) - starts[row]
+    counts = np.diff(np.append(starts, len(xs)))
+    mirrored = xs != 0
+    nonzero = np.bincount(row[mirrored], minlength=len(starts))
+    width = counts + nonzero
+    row_start = np.cumsum(width) - width
+
+    half = np.empty(width.sum(), dtype=dtype)
+    half[(row_start[row] + counts[row] - 1 - rank)[mirrored]] = -xs[mirrored]
+    half[row_start[row] + nonzero[row] + rank] = xs
+    half_ys = np.repeat(ys[starts], width)
+
+    # Строки y > 0 идут дважды: сверху в обратном порядке, снизу в прямом
+    axis = int(ys[0] == 0)
+    reverse = np.arange(len(starts) - 1, axis - 1, -1)
+    lengths = width[reverse]
+    top = np.repeat(row_start[reverse] - (np.cumsum(lengths) - lengths), lengths) + \
+        np.arange(lengths.sum())
+    points = np.empty((len(top) + len(half), 2), dtype=dtype)
+    points[:len(top), 0] = xc + half[top]
+    points[:len(top), 1] = yc - half_ys[top]
+    points[len(top):, 0] = xc + half
+    points[len(top):, 1] = yc + half_ys
+    # Отсекаем, только если фигура выходит за пределы (строки идут по возрастанию y)
+    if abs(xc) + xs.max() > max_coord or abs(yc) + ys[-1] > max_coord:
+        points = points[(np.abs(points) <= max_coord).all(axis=1)]
+    return points
+
+
+def circle_pixels(xc, yc, r, max_coord=MAX_COORD):
+    xs, ys = circle_quadrant(r)
+    return mirror_quadrant(xc, yc, np.concatenate((xs, ys)), np.concatenate((ys, xs)),
+                           max_coord)
+
+
+def ellipse_pixels(xc, yc, a, b):
+    return mirror_quadrant(xc, yc, *ellipse_quadrant(a, b))
+
+
+def iter_hermite(control_points, trace=None):
+    for i in range(len(control_points) - 1):
+        p0 = control_points[i]
+        p1 = control_points[i + 1]
+
+        t0 = 0
+        if i > 0:
+            t0 = (p1[0] - control_points[i - 1][0]) / 2
+
+        t1 = 0
+        if i < len(control_points) - 2:
+            t1 = (control_points[i + 2][0] - p0[0]) / 2
+
+        for t in [x * 0.01 for x in range(101)]:
+            h1 = 2 * t**3 - 3 * t**2 + 1
+            h2 = -2 * t**3 + 3 * t**2
+            h3 = t**3 - 2 * t**2 + t
+            h4 = t**3 - t**2
+
+            x = h1 * p0[0] + h2 * p1[0] + h3 * t0 + h4 * t1
+            y = h1 * p0[1] + h2 * p1[1] + h3 * t0 + h4 * t1
+
+            if trace is not None:
+                trace.append(round(x), round(y))
+            yield round(x), round(y)
+
+
+def iter_bezier(control_points, trace=None):
+    n_segments = (len(control_points) - 1) // 3
+
+    for seg in range(n_segments):
+        i = seg * 3
+        p0 = control_points[i]
+        p1 = control_points[i + 1]
+        p2 = control_points[i + 2]
+        p3 = control_points[i + 3]
+
+        for t in [x * 0.001 for x in range(1001)]:
+            x = (1 - t)**3 * p0[0] + 3 * (1 - t)**2 * t * p1[0] + \
+                3 * (1 - t) * t**2 * p2[0] + t**3 * p3[0]
+            y = (1 - t)**3 * p0[1] + 3 * (1 - t)**2 * t * p1[1] + \
+                3 * (1 - t) * t**2 * p2[1] + t**3 * p3[1]
+
+            if trace is not None:
+                trace.append(round(x), round(y))
+            yield round(x), round(y)
+
+
+def hermite_cubics(control_points):
+    cubics = []
+    for i in range(len(control_points) - 1):
+        p0 = control_points[i]
+        p1 = control_points[i + 1]
+
+        t0 = 0
+        if i > 0:
+            t0 = (p1[0] - control_points[i - 1][0]) / 2
+
+        t1 = 0
+        if i < len(control_points) - 2:
+            t1 = (control_points[i + 2][0] - p0[0]) / 2
+
+        # Тот же сегмент Эрмита в форме Безье: касательная (t, t) делится на 3
+        cubics.append((
+            p0[0], p0[1],
+            p0[0] + t0 / 3, p0[1] + t0 / 3,
+            p1[0] - t1 / 3, p1[1] - t1 / 3,
+            p1[0], p1[1],
+        ))
+    return cubics
+
+
+def bezier_cubics(control_points):
+    return [
+        (*control_points[i], *control_points[i + 1],
+         *control_points[i + 2], *control_points[i + 3])
+        for i in range(0, len(control_points) - 3, 3)
+    ]
+
+
+def bspline_cubics(control_points):
+    # Кусок равномерного кубического B-сплайна между узлами i+3 и i+4 зависит только
+    # от точек i..i+3 и точно записывается кубикой Безье
+    cubics = []
+    for i in range(len(control_points) - 3):
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = control_points[i:i + 4]
+        cubics.append((
+            (x0 + 4 * x1 + x2) / 6, (y0 + 4 * y1 + y2) / 6,
+            (2 * x1 + x2) / 3, (2 * y1 + y2) / 3,
+            (x1 + 2 * x2) / 3, (y1 + 2 * y2) / 3,
+            (x1 + 4 * x2 + x3) / 6, (y1 + 4 * y2 + y3) / 6,
+        ))
+    return cubics
+
+
+def iter_adaptive_hermite(control_points, trace=None):
+    return iter_cubic_pixels(hermite_cubics(control_points), trace)
+
+
+def iter_adaptive_bezier(control_points, trace=None):
+    return iter_cubic_pixels(bezier_cubics(control_points), trace)
+
+
+def iter_adaptive_bspline(control_points, trace=None):
+    return iter_cubic_pixels(bspline_cubics(control_points), trace)
+
+
+def iter_cubic_pixels(cubics, trace=None):
+    # Куски растеризуются независимо друг от друга, а повторы пикселей на стыках
+    # и самопересечениях убираются при склейке
+    seen = set()
+    for i, cubic in enumerate(cubics):
+        if i == 0:
+            first = (round(cubic[0]), round(cubic[1]))
+            seen.add(first)
+            if trace is not None:
+                trace.append(*first)
+            yield first
+
+        for pixel in iter_cubic_segment(cubic):
+            if pixel not in seen:
+                seen.add(pixel)
+                if trace is not None:
+                    trace.append(*pixel)
+                yield pixel
+
+
+def join_cubic_pieces(cubics, pieces):
+    # То же, что iter_cubic_pixels, из готовых пикселей кусков (массивов N x 2):
+    # остаётся первое вхождение каждого пикселя, но одной сортировкой, без множества
+    if not cubics:
+        return np.empty((0, 2), dtype=np.int64)
+    first = np.array([[round(cubics[0][0]), round(cubics[0][1])]], dtype=np.int64)
+    points = np.concatenate([first, *(piece.reshape(-1, 2) for piece in pieces)])
+    low = points.min(axis=0)
+    height = points[:, 1].max() - low[1] + 1
+    keys = (points[:, 0] - low[0]) * height + (points[:, 1] - low[1])
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    new = np.empty(len(keys), dtype=bool)
+    new[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=new[1:])
+    return points[np.sort(order[new])]
+
+
+def iter_cubic_segment(cubic):
+    # Кусок кривой делим пополам (де Кастельжо), пока он не станет почти плоским,
+    # а плоский проходим прямыми разностями с шагом не больше полпикселя.
+    # Так соседние отсчёты дают соседние пиксели, а работа растёт с длиной кривой.
+    # Начальный пиксель не выдаётся: он же конечный у предыдущего куска
+    last = (round(cubic[0]), round(cubic[1]))
+    stack = [(*cubic, 0)]
+    while stack:
+        x0, y0, x1, y1, x2, y2, x3, y3, depth = stack.pop()
+        legs = (max(abs(x1 - x0), abs(y1 - y0)), max(abs(x2 - x1), abs(y2 - y1)),
+                max(abs(x3 - x2), abs(y3 - y2)))
+        chord = max(abs(x3 - x0), abs(y3 - y0))
+        if depth < MAX_SUBDIVISION and sum(legs) > 1.5 * chord + 2:
+            x01, y01 = (x0 + x1) / 2, (y0 + y1) / 2
+            x12, y12 = (x1 + x2) / 2, (y1 + y2) / 2
+            x23, y23 = (x2 + x3) / 2, (y2 + y3) / 2
+            xa, ya = (x01 + x12) / 2, (y01 + y12) / 2
+            xb, yb = (x12 + x23) / 2, (y12 + y23) / 2
+            xm, ym = (xa + xb) / 2, (ya + yb) / 2
+            stack.append((xm, ym, xb, yb, x23, y23, x3, y3, depth + 1))
+            stack.append((x0, y0, x01, y01, xa, ya, xm, ym, depth + 1))
+            continue
+
+        # Производная кубики по каждой оси не больше 3 * max(legs)
+        steps = max(1, math.ceil(6 * max(legs)))
+        h = 1 / steps
+        ax, ay = x3 - x0 + 3 * (x1 - x2), y3 - y0 + 3 * (y1 - y2)
+        bx, by = 3 * (x0 - 2 * x1 + x2), 3 * (y0 - 2 * y1 + y2)
+        cx, cy = 3 * (x1 - x0), 3 * (y1 - y0)
+        fx, fy = x0, y0
+        dfx = ((ax * h + bx) * h + cx) * h
+        dfy = ((ay * h + by) * h + cy) * h
+        d3x, d3y = 6 * ax * h**3, 6 * ay * h**3
+        d2x, d2y = d3x + 2 * bx * h * h, d3y + 2 * by * h * h
+
+        for step in range(steps):
+            if step == steps - 1:
+                fx, fy = x3, y3
+            else:
+                fx += dfx
+                fy += dfy
+                dfx += d2x
+                dfy += d2y
+                d2x += d3x
+                d2y += d3y
+            pixel = (round(fx), round(fy))
+            if pixel == last:
+                continue
+            last = pixel
+            yield pixel
+
+
+def uniform_knots(n, degree):
+    return tuple(range(n + degree + 1))
+
+
+def clamped_knots(n, degree):
+    inner = n - degree
+    return (0,) * degree + tuple(range(inner + 1)) + (inner,) * degree
+
+
+def make_knots(n, degree, knots=None):
+    if knots is None or knots == "uniform":
+        return uniform_knots(n, degree)
+    if knots == "clamped":
+        return clamped_knots(n, degree)
+    knots = tuple(float(k) for k in knots)
+    if len(knots) != n + degree + 1:
+        raise ValueError(f"Нужно {n + degree + 1} узлов для {n} точек степени {degree}")
+    if any(b < a for a, b in zip(knots, knots[1:])):
+        raise ValueError("Узловой вектор должен быть неубывающим")
+    if knots[degree] >= knots[n]:
+        raise ValueError("Пустая область определения B-сплайна")
+    return knots
+
+
+def bspline_basis_table(n, degree, knots, t):
+    # Для каждого t — индекс первой управляющей точки и degree + 1 ненулевых
+    # базисных функций; схема Кокса — де Бура снизу вверх сразу по всем t
+    knots = np.asarray(knots, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    span = np.searchsorted(knots, t, side="right") - 1
+    # Правый конец области попадает в последний промежуток ненулевой длины: при
+    # повторённых узлах промежуток n - 1 может быть пустым, и деление даст NaN
+    last = np.flatnonzero(knots[degree:n] < knots[degree + 1:n + 1])[-1] + degree
+    span = np.clip(span, degree, last)
+
+    values = np.zeros((len(t), degree + 1))
+    values[:, 0] = 1.0
+    left = np.empty((len(t), degree + 1))
+    right = np.empty((len(t), degree + 1))
+    for j in range(1, degree + 1):
+        left[:, j] = t - knots[span + 1 - j]
+        right[:, j] = knots[span + j] - t
+        saved = np.zeros(len(t))
+        for r in range(j):
+            temp = values[:, r] / (right[:, r + 1] + left[:, j - r])
+            values[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+        values[:, j] = saved
+    return span - degree, values
+
+
+@lru_cache(maxsize=64)
+def cached_basis_table(n, degree, knots, samples):
+    t = np.linspace(knots[degree], knots[n], samples)
+    first, values = bspline_basis_table(n, degree, knots, t)
+    first.flags.writeable = False
+    values.flags.writeable = False
+    return first, values
+
+
+def bspline_curve(control_points, degree=3, knots=None, samples=BSPLINE_SAMPLES, t=None):
+    points = np.asarray(control_points, dtype=np.float64)
+    n = len(points)
+    if n <= degree:
+        raise ValueError(f"Для B-сплайна степени {degree} нужно минимум {degree + 1} точки")
+    knots = make_knots(n, degree, knots)
+    if t is None:
+        first, values = cached_basis_table(n, degree, knots, samples)
+    else:
+        first, values = bspline_basis_table(n, degree, knots, t)
+
+    index = first[:, None] + np.arange(degree + 1)
+    return np.einsum("sj,sjk->sk", values, points[index])
+
+
+def iter_bspline(control_points, trace=None, degree=3, knots=None,
+                 samples=BSPLINE_SAMPLES, t=None):
+    # Соседние отсчёты соединяются отрезками ЦДА, поэтому пиксели идут без разрывов
+    # при любом числе отсчётов; повторы на стыках и самопересечениях пропускаются
+    curve = np.rint(bspline_curve(control_points, degree, knots, samples, t))
+    curve = [tuple(point) for point in curve.astype(np.int64).tolist()]
+    seen = set()
+    for start, end in zip(curve[:1] + curve, curve):
+        for pixel in iter_dda(start, end) if start != end else (end,):
+            if pixel not in seen:
+                seen.add(pixel)
+                if trace is not None:
+                    trace.append(*pixel)
+                yield pixel
+
+
+def bspline_basis(i, k, knots, t):
+    if k == 0:
+        return ((knots[i] <= t) & (t < knots[i + 1])).astype(float)
+    else:
+        denom1 = knots[i + k] - knots[i]
+        term1 = 0 if denom1 == 0 else (t - knots[i]) / denom1 * \
+            bspline_basis(i, k - 1, knots, t)
+
+        denom2 = knots[i + k + 1] - knots[i + 1]
+        term2 = 0 if denom2 == 0 else (knots[i + k + 1] - t) / denom2 * \
+            bspline_basis(i + 1, k - 1, knots, t)
+
+        return term1 + term2
+
+
+FILL_RULES = ("evenodd", "nonzero")
+
+
+def edge_table(vertices):
+    # Рёбра по первой строке, которую они пересекают: [строка конца (не включая),
+    # x на текущей строке, нижняя вершина, dx, dy, направление обхода].
+    # Строка y пересекает ребро, если y0 <= y < y1, поэтому вершины не считаются дважды
+    table = {}
+    n = len(vertices)
+    for i in range(n):
+        (x0, y0), (x1, y1) = vertices[i], vertices[(i + 1) % n]
+        if y0 == y1:
+            continue
+        direction = 1 if y1 > y0 else -1
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        first = math.ceil(y0)
+        last = math.ceil(y1)
+        if first >= last:
+            continue
+        edge = [last, 0, x0, y0, x1 - x0, y1 - y0, direction]
+        table.setdefault(first, []).append(edge)
+    return table
+
+
+def iter_scanline_fill(vertices, rule="evenodd", trace=None):
+    # Заливка строками с таблицей рёбер и списком активных рёбер.
+    # Выдаёт отрезки строк (y, x0, x1) включительно: пиксель закрашен, если x_левый <= x < x_правый
+    if rule not in FILL_RULES:
+        raise ValueError(f"Неизвестное правило заливки: {rule!r}")
+    table = edge_table(vertices)
+    active = []
+    y = min(table, default=0)
+    while active or table:
+        if not active:
+            y = min(table)
+        active.extend(table.pop(y, ()))
+        active = [edge for edge in active if edge[0] > y]
+        for edge in active:
+            # x считается от вершины, а не накоплением приращений: на целых вершинах
+            # пересечение с целым x не сдвигается ошибкой округления
+            edge[1] = edge[2] + edge[4] * (y - edge[3]) / edge[5]
+        active.sort(key=lambda edge: edge[1])
+
+        winding = 0
+        left = None
+        for edge in active:
+            if rule == "evenodd":
+                inside = left is None
+            else:
+                winding += edge[6]
+                inside = winding != 0
+            if inside and left is None:
+                left = edge[1]
+            elif not inside and left is not None:
+                x0 = math.ceil(left)
+                x1 = math.ceil(edge[1]) - 1
+                left = None
+                if x0 <= x1:
+                    if trace is not None:
+                        trace.append(x0, y)
+                        trace.append(x1, y, action="H")
+                    yield y, x0, x1
+        y += 1
+
+
+def span_pixels(spans):
+    # Отрезки строк (y, x0, x1) в пиксели (x, y) построчно
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 3)
+    lengths = spans[:, 2] - spans[:, 1] + 1
+    starts = np.cumsum(lengths) - lengths
+    xs = np.repeat(spans[:, 1] - starts, lengths) + np.arange(lengths.sum())
+    return np.column_stack((xs, np.repeat(spans[:, 0], lengths)))
+
+
+def span_count(spans):
+    # Число пикселей в отрезках строк (y, x0, x1)
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 3)
+    return int((spans[:, 2] - spans[:, 1] + 1).sum())
+
+
+def clip_spans(spans, bounds):
+    x0, y0, x1, y1 = bounds
+    spans = spans[(spans[:, 0] >= y0) & (spans[:, 0] <= y1) &
+                  (spans[:, 1] <= x1) & (spans[:, 2] >= x0)]
+    return np.column_stack((spans[:, 0], np.maximum(spans[:, 1], math.floor(x0)),
+                            np.minimum(spans[:, 2], math.ceil(x1)), spans[:, 3:]))
+
+
+def pixel_spans(points):
+    # Пиксели (x, y[, значения...]) в отрезки строк (y, x0, x1[, значения...]):
+    # соседние пиксели строки объединяются, если значения (покрытие, цвет) у них равны.
+    # Из повторов пикселя остаётся последний, как при рисовании поверх
+    points = np.asarray(points)
+    if not points.size:
+        return np.empty((0, 3), dtype=np.int64)
+    points = points.reshape(len(points), -1)
+    keys, _, _ = pack_cells(points[:, 1::-1].astype(np.float64))
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    points = points[order[last]]
+
+    xs = points[:, 0]
+    ys = points[:, 1]
+    values = points[:, 2:]
+    first = np.ones(len(points), dtype=bool)
+    first[1:] = ((ys[1:] != ys[:-1]) | (xs[1:] != xs[:-1] + 1) |
+                 (values[1:] != values[:-1]).any(axis=1))
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(points)) - 1
+    return np.column_stack((ys[starts], xs[starts], xs[ends], values[starts]))
+
+
+def pixel_array(points):
+    # Пиксели (x, y) и (x, y, покрытие) в массив N x 3, непрозрачным — покрытие 1
+    if isinstance(points, np.ndarray):
+        if not points.size:
+            return np.empty((0, 3))
+        points = points.reshape(len(points), -1).astype(np.float64)
+        if points.shape[1] == 3:
+            return points
+        return np.column_stack((points, np.ones(len(points))))
+    return np.array([(point[0], point[1], point[2] if len(point) == 3 else 1.0)
+                     for point in points], dtype=np.float64).reshape(-1, 3)
+
+
+class CoverageBuffer:
+    # Накопитель сглаженных пикселей: вклады с покрытием 0..1 смешиваются
+    # оператором "over" в порядке поступления и переводятся в цвет за один проход.
+    # Непрозрачные пиксели — вклады с покрытием 1
+    def __init__(self):
+        self.parts = []
+
+    def __len__(self):
+        return sum(len(part[1]) for part in self.parts)
+
+    def deposit(self, coords, coverage=1.0, rgb=(0, 0, 0)):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        coverage = np.clip(np.broadcast_to(np.asarray(coverage, dtype=np.float64),
+                                           len(coords)), 0, 1)
+        self.parts.append((coords, coverage, np.asarray(rgb, dtype=np.float64)))
+
+    def resolve(self, background=(255, 255, 255)):
+        if not self.parts:
+            return np.empty((0, 2)), np.empty((0, 3), dtype=np.uint8)
+        coords = np.concatenate([part[0] for part in self.parts])
+        alpha = np.concatenate([part[1] for part in self.parts])
+        background = np.asarray(background, dtype=np.float64)
+
+        inks = [part[2] for part in self.parts]
+        if all(ink.shape == (3,) and (ink == inks[0]).all() for ink in inks):
+            cells, covered = self.blend_uniform(coords, alpha)
+            color = np.outer(covered, inks[0]) + np.outer(1 - covered, background)
+        else:
+            rgb = np.concatenate([np.broadcast_to(ink, (len(part[1]), 3))
+                                  for ink, part in zip(inks, self.parts)])
+            cells, covered, color = self.blend(coords, alpha, rgb)
+            color += (1 - covered[:, None]) * background
+        return cells, np.clip(np.rint(color), 0, 255).astype(np.uint8)
+
+    def blend_uniform(self, coords, alpha):
+        # При одном цвете порядок не важен: непрозрачность ячейки 1 - П(1 - a),
+        # произведение считается суммой логарифмов без сортировки
+        keys, unpack, span = pack_cells(coords)
+        with np.errstate(divide="ignore"):
+            weights = np.log1p(-alpha)
+        if span is not None and span <= 4 * len(keys) + 2**20:
+            cells = np.flatnonzero(np.bincount(keys, minlength=span))
+            transmit = np.exp(np.bincount(keys, weights=weights, minlength=span)[cells])
+        else:
+            cells, inverse = np.unique(keys, return_inverse=True)
+            transmit = np.exp(np.bincount(inverse.ravel(), weights=weights))
+        keep = transmit < 1
+        return unpack(cells[keep]), 1 - transmit[keep]
+
+    def blend(self, coords, alpha, rgb):
+        # Вклады одной ячейки идут подряд и в порядке поступления
+        keys, unpack, _ = pack_cells(coords)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        first = np.empty(len(keys), dtype=bool)
+        first[:1] = True
+        np.not_equal(keys[1:], keys[:-1], out=first[1:])
+        starts = np.flatnonzero(first)
+        cell = np.cumsum(first) - 1
+
+        a = alpha[order]
+        color = rgb[order[starts]] * a[starts, None]
+        covered = a[starts].copy()
+
+        # Проход k смешивает k-е вклады всех ячеек: внутри прохода ячейки не повторяются
+        later = np.flatnonzero(~first)
+        if len(later):
+            rank = later - starts[cell[later]]
+            later = later[np.argsort(rank.astype(np.min_scalar_type(rank.max())), kind="stable")]
+            for part in np.split(later, np.cumsum(np.bincount(rank))[1:-1]):
+                c = cell[part]
+                ap = a[part]
+                color[c] = rgb[order[part]] * ap[:, None] + color[c] * (1 - ap[:, None])
+                covered[c] = ap + covered[c] * (1 - ap)
+
+        keep = covered > 0
+        return unpack(keys[starts[keep]]), covered[keep], color[keep]
+
+    def clear(self):
+        self.parts.clear()
+
+
+def pack_cells(coords):
+    # Ключ ячейки: целые координаты упаковываются в int64 (span — число возможных
+    # ключей), остальные — в комплексное число
+    xs = coords[:, 0]
+    ys = coords[:, 1]
+    if len(xs) and (xs == np.floor(xs)).all() and (ys == np.floor(ys)).all():
+        x_min = int(xs.min())
+        y_min = int(ys.min())
+        height = int(ys.max()) - y_min + 1
+        span = (int(xs.max()) - x_min + 1) * height
+        if span < 2**62:
+            keys = (xs - x_min).astype(np.int64) * height + (ys - y_min).astype(np.int64)
+
+            def unpack(keys):
+                return np.column_stack((keys // height + x_min,
+                                        keys % height + y_min)).astype(np.float64)
+
+            return keys, unpack, span
+
+    def unpack(keys):
+        return np.column_stack((keys.real, keys.imag))
+
+    return xs + 1j * ys, unpack, None
+
+
+def iter_chunks(pixels, size=1024):
+    pixels = iter(pixels)
+    while chunk := list(islice(pixels, size)):
+        yield chunk
+
+
+def as_segments(segments):
+    segments = np.asarray(segments)
+    if segments.ndim != 2 or segments.shape[1] != 4:
+        raise ValueError("Ожидается массив отрезков формы (N, 4)")
+    return segments
+
+
+def segment_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def accumulate(starts, incs, counts, out=None, first=None):
+    # Последовательности start, start+inc, start+2*inc, ... длиной counts.
+    # cumsum по строке складывает слева направо, поэтому результат совпадает
+    # с накоплением "x += inc" в скалярных алгоритмах бит в бит.
+    # С out последовательность i пишется в out с позиции first[i], иначе подряд
+    starts = np.asarray(starts, dtype=np.float64)
+    incs = np.asarray(incs, dtype=np.float64)
+    flat = starts.ndim == 1
+    if flat:
+        starts = starts[:, None]
+        incs = incs[:, None]
+    counts = np.asarray(counts, dtype=np.int64)
+    if first is None:
+        first = segment_offsets(counts)[:-1]
+    if out is None:
+        out = np.empty((int(counts.sum()), starts.shape[1]), dtype=np.float64)
+    target = out[:, None] if out.ndim == 1 else out
+
+    # Отрезки одной длины считаем одним плотным блоком и сразу пишем на место
+    order = np.argsort(counts, kind="stable")
+    sorted_counts = counts[order]
+    bounds = np.flatnonzero(np.diff(sorted_counts)) + 1
+    for begin, end in zip([0, *bounds], [*bounds, len(order)]):
+        width = int(sorted_counts[begin]) if end > begin else 0
+        if not width:
+            continue
+        rows = order[begin:end]
+        block = np.empty((len(rows), width, starts.shape[1]), dtype=np.float64)
+        block[:, 0] = starts[rows]
+        block[:, 1:] = incs[rows, None]
+        np.cumsum(block, axis=1, out=block)
+        target[first[rows, None] + np.arange(width)] = block
+    return out[:, 0] if flat and out.ndim == 2 else out
+
+
+def dda_batch(segments):
+    segments = as_segments(segments)
+    x1, y1, x2, y2 = (segments[:, i].astype(np.int64) for i in range(4))
+    dx = x2 - x1
+    dy = y2 - y1
+    steps = np.maximum(np.abs(dx), np.abs(dy))
+    counts = np.where(steps == 0, 0, steps + 1)
+    safe_steps = np.maximum(steps, 1)
+
+    xy = accumulate(np.column_stack((x1, y1)),
+                    np.column_stack((dx / safe_steps, dy / safe_steps)), counts)
+    points = np.empty(xy.shape, dtype=np.int64)
+    np.rint(xy, out=points, casting="unsafe")
+    return points, segment_offsets(counts)
+
+
+def normalize_segments(x1, y1, x2, y2, steep):
+    x1, y1 = np.where(steep, y1, x1), np.where(steep, x1, y1)
+    x2, y2 = np.where(steep, y2, x2), np.where(steep, x2, y2)
+    swap = x1 > x2
+    x1, x2 = np.where(swap, x2, x1), np.where(swap, x1, x2)
+    y1, y2 = np.where(swap, y2, y1), np.where(swap, y1, y2)
+    return x1, y1, x2, y2
+
+
+def bresenham_batch(segments):
+    segments = as_segments(segments)
+    x1, y1, x2, y2 = (segments[:, i].astype(np.int64) for i in range(4))
+    steep = np.abs(y2 - y1) > np.abs(x2 - x1)
+    x1, y1, x2, y2 = normalize_segments(x1, y1, x2, y2, steep)
+
+    dx = x2 - x1
+    dy = np.abs(y2 - y1)
+    counts = dx + 1
+    offsets = segment_offsets(counts)
+
+    # Промежуточное i * dy не превосходит dx * dy, при малых отрезках хватает int32
+    small = not len(dx) or (
+        (int(dx.max()) + 1) * (int(dy.max()) + 1) < 2**31
+        and int(np.abs(segments).max()) < 2**30
+    )
+    dtype = np.int32 if small else np.int64
+    i = np.arange(offsets[-1], dtype=dtype)
+    i -= np.repeat(offsets[:-1].astype(dtype), counts)
+
+    # Число шагов по y к i-му пикселю: наименьшее k, при котором
+    # ошибка dx // 2 - i * dy + k * dx остаётся неотрицательной.
+    span = np.maximum(dx, 1)
+    k = i * np.repeat(dy.astype(dtype), counts)
+    k += np.repeat((span - 1 - dx // 2).astype(dtype), counts)
+    k //= np.repeat(span.astype(dtype), counts)
+    k *= np.repeat(np.where(y1 < y2, 1, -1).astype(dtype), counts)
+    k += np.repeat(y1.astype(dtype), counts)
+    i += np.repeat(x1.astype(dtype), counts)
+
+    steep = np.repeat(steep, counts)
+    points = np.empty((len(i), 2), dtype=np.int64)
+    points[:, 0] = np.where(steep, k, i)
+    points[:, 1] = np.where(steep, i, k)
+    return points, offsets
+
+
+def wu_batch(segments):
+    segments = as_segments(segments)
+    x1, y1, x2, y2 = (segments[:, i].astype(np.float64) for i in range(4))
+    dx = x2 - x1
+    dy = y2 - y1
+    steep = np.abs(dy) > np.abs(dx)
+    dx, dy = np.where(steep, dy, dx), np.where(steep, dx, dy)
+    x1, y1, x2, y2 = normalize_segments(x1, y1, x2, y2, steep)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gradient = np.where(dx != 0, dy / np.where(dx != 0, dx, 1), 1.0)
+
+    xend1 = np.round(x1)
+    yend1 = y1 + gradient * (xend1 - x1)
+    xend2 = np.round(x2)
+    yend2 = y2 + gradient * (xend2 - x2)
+    xpxl1 = xend1.astype(np.int64)
+    xpxl2 = xend2.astype(np.int64)
+
+    # Пиксели идут парами (x, y) и (x, y + 1) по главной оси: у отрезка пара
+    # начала, пара конца и по паре на каждый столбец между ними
+    inner = np.maximum(xpxl2 - xpxl1 - 1, 0)
+    pairs = inner + 2
+    pair_offsets = segment_offsets(pairs)
+    start = pair_offsets[:-1]
+    total = pair_offsets[-1]
+
+    y = np.empty(total)
+    y[start] = yend1
+    y[start + 1] = yend2
+    accumulate(yend1 + gradient, gradient, inner, y, start + 2)
+
+    # Столбец j-й пары внутри отрезка — xpxl1 + j - 1, у концов свои
+    x = np.repeat(xpxl1 - 1 - start, pairs)
+    x += np.arange(total)
+    x[start] = xpxl1
+    x[start + 1] = xpxl2
+    minor = np.floor(y)
+    y -= minor
+    minor = minor.astype(np.int64)
+
+    # Внутри отрезка gap = 1, поэтому на него умножаются только концы
+    coverage = np.empty((total, 2))
+    np.subtract(1, y, out=coverage[:, 0])
+    coverage[:, 1] = y
+    gap1 = 1 - (x1 + 0.5) % 1
+    gap2 = (x2 + 0.5) % 1
+    for column in coverage.T:
+        column[start] *= gap1
+        column[start + 1] *= gap2
+
+    # У крутых отрезков оси меняются местами: s = 1 переставляет x и y,
+    # второй пиксель пары сдвинут на s по x и на 1 - s по y
+    s = np.repeat(steep, pairs)
+    swap = minor - x
+    swap *= s
+    points = np.empty((total, 2, 2), dtype=np.int64)
+    np.add(x, swap, out=points[:, 0, 0])
+    np.subtract(minor, swap, out=points[:, 0, 1])
+    np.add(points[:, 0, 0], s, out=points[:, 1, 0])
+    np.add(points[:, 0, 1], ~s, out=points[:, 1, 1])
+    return points.reshape(-1, 2), coverage.reshape(-1), 2 * pair_offsets
+
+
+def segment_work(segments):
+    x1, y1, x2, y2 = (segments[:, i].astype(np.int64) for i in range(4))
+    return np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) + 1
+
+
+def split_segments(segments, parts):
+    # Куски с примерно равным числом пикселей, а не отрезков
+    work = np.cumsum(segment_work(segments))
+    cuts = np.searchsorted(work, work[-1] * np.arange(1, parts) / parts, side="right")
+    cuts = np.unique(np.concatenate(([0], cuts, [len(segments)])))
+    return [segments[begin:end] for begin, end in zip(cuts[:-1], cuts[1:])]
+
+
+def merge_batches(results):
+    # Результаты кусков склеиваются в исходном порядке, смещения сдвигаются
+    # на число пикселей в предыдущих кусках
+    *columns, offsets = zip(*results)
+    merged = [np.concatenate(column) for column in columns]
+    bases = np.cumsum([0] + [part[-1] for part in offsets[:-1]])
+    offsets = np.concatenate([offsets[0][:1]] +
+                             [part[1:] + base for part, base in zip(offsets, bases)])
+    return (*merged, offsets)
+
+
+def parallel_batch(batch, segments, workers=None, pool=None, chunk=PARALLEL_CHUNK):
+    # Пакетный алгоритм по процессам: каждый кусок считается той же функцией,
+    # поэтому результат совпадает с последовательным запуском
+    segments = as_segments(segments)
+    if len(segments) <= chunk or (pool is None and workers == 1):
+        return batch(segments)
+    if pool is None:
+        with ProcessPoolExecutor(workers) as pool:
+            return parallel_batch(batch, segments, workers, pool, chunk)
+    parts = max((workers or os.cpu_count() or 1) * 4, math.ceil(len(segments) / chunk))
+    return merge_batches(list(pool.map(batch, split_segments(segments, parts))))
@@ -0,0 +1,330 @@
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import raster
+import scenefile
+
+LINE_BATCHES = {
+    "dda": raster.dda_batch,
+    "bresenham": raster.bresenham_batch,
+    "wu": raster.wu_batch,
+}
+
+
+CURVE_PARAMS = {
+    "circle": ("radius",),
+    "ellipse": ("a", "b"),
+    "hyperbola": ("a", "b"),
+    "parabola": ("p",),
+}
+
+
+class JobError(ValueError):
+    pass
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_point(value):
+    return isinstance(value, (list, tuple)) and len(value) == 2 and all(map(is_number, value))
+
+
+def check_primitive(primitive):
+    # Форма и типы проверяются до растеризации, иначе ошибка всплывает из
+    # глубины алгоритма как AttributeError или TypeError
+    if not isinstance(primitive, dict):
+        raise JobError(f"Примитив задаётся объектом, получено: {primitive!r}")
+    if "type" not in primitive:
+        raise JobError("Не задан тип примитива")
+    kind = primitive["type"]
+    if not isinstance(kind, str):
+        raise JobError(f"Неизвестный тип примитива: {kind!r}")
+    for name in CURVE_PARAMS.get(kind, ()):
+        if name in primitive and not is_number(primitive[name]):
+            raise JobError(f"Параметр {name!r} для {kind} должен быть числом")
+    for name in ("center", "start", "end"):
+        if name in primitive and not is_point(primitive[name]):
+            raise JobError(f"Параметр {name!r} для {kind} задаётся парой чисел")
+    points = primitive.get("points", [])
+    if not isinstance(points, list) or not all(map(is_point, points)):
+        raise JobError(f"Точки {kind} задаются парами чисел")
+    # При a <= 0 ветвь гиперболы не сдвигается по x и без границ не кончается
+    if kind == "hyperbola" and not (primitive.get("a", 1) > 0 and primitive.get("b", 1) > 0):
+        raise JobError("Для гиперболы нужны a > 0 и b > 0")
+
+
+def check_job(job):
+    primitives = job.get("primitives") if isinstance(job, dict) else job
+    if not isinstance(primitives, list):
+        raise JobError("Задание — список примитивов или объект с полем 'primitives'")
+    options = job if isinstance(job, dict) else {}
+    bounds = options.get("bounds")
+    if bounds is not None and not (isinstance(bounds, (list, tuple)) and len(bounds) == 4
+                                   and all(map(is_number, bounds))):
+        raise JobError("Параметр 'bounds' задаётся четырьмя числами")
+    if not is_number(options.get("max_coord", 0)):
+        raise JobError("Параметр 'max_coord' должен быть числом")
+    for primitive in primitives:
+        check_primitive(primitive)
+    return primitives, options
+
+
+def parse_color(color):
+    if isinstance(color, str) and color.startswith("#") and len(color) == 7:
+        return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+    if isinstance(color, (list, tuple)) and len(color) == 3:
+        return tuple(int(c) for c in color)
+    raise JobError(f"Некорректный цвет: {color!r}")
+
+
+def control_points(primitive):
+    points = [tuple(point) for point in primitive.get("points", [])]
+    kind = primitive["type"]
+    if len(points) < 2:
+        raise JobError("Добавьте минимум 2 точки")
+    if kind == "bezier" and (len(points) - 1) % 3 != 0:
+        raise JobError("Для кривой Безье нужно 3n+1 точек (4,7,10...)")
+    degree = primitive.get("degree", 3)
+    if kind == "bspline" and len(points) <= degree:
+        raise JobError(f"Для B-сплайна степени {degree} нужно минимум {degree + 1} точки")
+    if kind == "polygon" and len(points) < 3:
+        raise JobError("Для многоугольника нужно минимум 3 точки")
+    return points
+
+
+def rasterize_curve(primitive, max_coord, bounds=None):
+    kind = primitive["type"]
+    xc, yc = primitive.get("center", (0, 0))
+    if kind == "circle":
+        return raster.circle_pixels(xc, yc, primitive["radius"], max_coord)
+    if kind == "ellipse":
+        return raster.ellipse_pixels(xc, yc, primitive["a"], primitive["b"])
+    if kind == "hyperbola":
+        return raster.iter_bresenham_hyperbola(xc, yc, primitive["a"], primitive["b"],
+                                               max_coord=max_coord, bounds=bounds)
+    if kind == "parabola":
+        return raster.iter_midpoint_parabola(xc, yc, primitive["p"], max_coord=max_coord,
+                                             bounds=bounds)
+    if kind == "hermite":
+        return raster.iter_adaptive_hermite(control_points(primitive))
+    if kind == "bezier":
+        return raster.iter_adaptive_bezier(control_points(primitive))
+    if kind == "bspline":
+        return raster.iter_bspline(
+            control_points(primitive),
+            degree=primitive.get("degree", 3),
+            knots=primitive.get("knots"),
+            samples=primitive.get("samples", raster.BSPLINE_SAMPLES),
+        )
+    if kind == "polygon":
+        rule = primitive.get("rule", "evenodd")
+        if rule not in raster.FILL_RULES:
+            raise JobError(f"Неизвестное правило заливки: {rule!r}")
+        return raster.span_pixels(list(raster.iter_scanline_fill(control_points(primitive),
+                                                                 rule)))
+    raise JobError(f"Неизвестный тип примитива: {kind!r}")
+
+
+def line_algorithm(line):
+    return line.get("algorithm", "bresenham")
+
+
+def line_segment(line):
+    try:
+        (x0, y0), (x1, y1) = line["start"], line["end"]
+    except KeyError as error:
+        raise JobError(f"Не задан параметр {error} для line") from None
+    except (TypeError, ValueError):
+        raise JobError("Начало и конец отрезка задаются парами координат") from None
+    return x0, y0, x1, y1
+
+
+def rasterize_lines(lines, background="#ffffff", workers=1, pool=None):
+    algorithm = line_algorithm(lines[0])
+    if algorithm not in LINE_BATCHES:
+        raise JobError(f"Неизвестный алгоритм отрезка: {algorithm!r}")
+    segments = np.array([line_segment(line) for line in lines], dtype=np.int64)
+    colors = np.array([parse_color(line.get("color", "#000000")) for line in lines],
+                      dtype=np.uint8)
+
+    if algorithm == "wu":
+        # Перекрывающиеся сглаженные отрезки смешиваются, а не затирают друг друга
+        points, coverage, offsets = raster.parallel_batch(raster.wu_batch, segments,
+                                                          workers, pool)
+        buffer = raster.CoverageBuffer()
+        buffer.deposit(points, coverage, np.repeat(colors, np.diff(offsets), axis=0))
+        return buffer.resolve(parse_color(background))
+
+    points, offsets = raster.parallel_batch(LINE_BATCHES[algorithm], segments, workers, pool)
+    return points, np.repeat(colors, np.diff(offsets), axis=0)
+
+
+def rasterize_job(job, workers=1):
+    if workers == 1:
+        return rasterize_primitives(job)
+    # Один пул на всё задание: процессы не перезапускаются для каждой группы отрезков
+    with ProcessPoolExecutor(workers) as pool:
+        return rasterize_primitives(job, workers, pool)
+
+
+def rasterize_primitives(job, workers=1, pool=None):
+    # Подряд идущие отрезки одного алгоритма растеризуются одним пакетом
+    primitives, options = check_job(job)
+    max_coord = options.get("max_coord", math.inf)
+    background = options.get("background", "#ffffff")
+    # Открытые кривые строятся только в пределах изображения, если оно задано
+    bounds = tuple(options["bounds"]) if "bounds" in options else None
+    layers = []
+    pending = []
+
+    def flush():
+        if pending:
+            layers.append(rasterize_lines(pending, background, workers, pool))
+            pending.clear()
+
+    for primitive in primitives:
+        if primitive.get("type") == "line":
+            if pending and line_algorithm(pending[0]) != line_algorithm(primitive):
+                flush()
+            pending.append(primitive)
+            continue
+        flush()
+        try:
+            points = rasterize_curve(primitive, max_coord, bounds)
+            if not isinstance(points, np.ndarray):
+                points = list(points)
+            points = np.array(points, dtype=np.float64)
+        except KeyError as error:
+            raise JobError(f"Не задан параметр {error} для {primitive.get('type', '?')}") from None
+        points = points.reshape(-1, 2)
+        color = parse_color(primitive.get("color", "#000000"))
+        layers.append((points, np.tile(np.array(color, dtype=np.uint8), (len(points), 1))))
+    flush()
+
+    if not layers:
+        return np.empty((0, 2), dtype=np.int64), np.empty((0, 3), dtype=np.uint8)
+    points = np.concatenate([np.floor(points) for points, _ in layers]).astype(np.int64)
+    colors = np.concatenate([colors for _, colors in layers])
+    return points, colors
+
+
+def render_image(points, colors, bounds=None, scale=1, background="#ffffff"):
+    if bounds is None:
+        if len(points):
+            bounds = (*points.min(axis=0), *points.max(axis=0))
+        else:
+            bounds = (0, 0, 0, 0)
+    x_min, y_min, x_max, y_max = (int(v) for v in bounds)
+    width = x_max - x_min + 1
+    height = y_max - y_min + 1
+
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[:] = parse_color(background)
+    inside = ((points[:, 0] >= x_min) & (points[:, 0] <= x_max) &
+              (points[:, 1] >= y_min) & (points[:, 1] <= y_max))
+    pixels[points[inside, 1] - y_min, points[inside, 0] - x_min] = colors[inside]
+
+    if scale > 1:
+        pixels = pixels.repeat(scale, axis=0).repeat(scale, axis=1)
+    return pixels
+
+
+def encode_ppm(pixels):
+    height, width = pixels.shape[:2]
+    return f"P6 {width} {height} 255\n".encode("ascii") + pixels.tobytes()
+
+
+def encode_png(pixels):
+    height, width = pixels.shape[:2]
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) +
+            chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) + chunk(b"IEND", b""))
+
+
+def write_points(path, points, colors):
+    if path.endswith(".gsc"):
+        scenefile.save_points(path, points)
+        return
+    if path.endswith(".npy"):
+        np.save(path, np.column_stack((points, colors)))
+        return
+    with open(path, "w", encoding="utf-8") as file:
+        for (x, y), (r, g, b) in zip(points.tolist(), colors.tolist()):
+            file.write(f"{x} {y} #{r:02x}{g:02x}{b:02x}\n")
+
+
+def write_spans(path, points, colors):
+    # Отрезки строк одного цвета: "y x0 x1 #rrggbb", пиксели x0..x1 включительно
+    spans = raster.pixel_spans(np.column_stack((points, colors.astype(np.int64))))
+    with open(path, "w", encoding="utf-8") as file:
+        for y, x0, x1, r, g, b in spans.tolist():
+            file.write(f"{y} {x0} {x1} #{r:02x}{g:02x}{b:02x}\n")
+
+
+def load_job(path):
+    if path == "-":
+        return json.load(sys.stdin)
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Пакетная растеризация примитивов без графического интерфейса")
+    parser.add_argument("job", help="JSON-файл задания ('-' для stdin)")
+    parser.add_argument("-o", "--output", help="изображение .png или .ppm")
+    parser.add_argument("-p", "--points", help="дамп пикселей .txt, .npy или .gsc")
+    parser.add_argument("-s", "--spans", help="дамп отрезков строк .txt")
+    parser.add_argument("--scale", type=int, default=None, help="размер пикселя в точках")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="число процессов для отрезков (0 — по числу ядер)")
+    args = parser.parse_args(argv)
+
+    try:
+        job = load_job(args.job)
+        points, colors = rasterize_job(job, args.jobs or os.cpu_count())
+    except (OSError, ValueError) as error:
+        print(f"Ошибка: {error}", file=sys.stderr)
+        return 2
+
+    if args.points:
+        write_points(args.points, points, colors)
+
+    if args.spans:
+        write_spans(args.spans, points, colors)
+
+    if args.output:
+        options = job if isinstance(job, dict) else {}
+        pixels = render_image(
+            points, colors,
+            bounds=options.get("bounds"),
+            scale=args.scale or options.get("scale", 1),
+            background=options.get("background", "#ffffff"),
+        )
+        data = encode_ppm(pixels) if args.output.endswith(".ppm") else encode_png(pixels)
+        with open(args.output, "wb") as file:
+            file.write(data)
+
+    print(f"Пикселей: {len(points)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
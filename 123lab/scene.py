@@ -0,0 +1,289 @@
+import math
+
+import numpy as np
+
+import raster
+
+GRID_CELL = 32
+
+
+def as_spans(spans):
+    spans = np.asarray(spans)
+    spans = spans.reshape(len(spans), -1) if spans.size else np.empty((0, 3))
+    # Столбец покрытия сглаженных отрезков дробный, остальные — целые
+    return spans if spans.dtype.kind == "f" and spans.shape[1] > 3 else spans.astype(np.int64)
+
+
+class Primitive:
+    # Пиксели из файла сцены хранит StoredPrimitive
+    record = None
+
+    def __init__(self, id, kind, params, points, extent=None, spans=None):
+        self.id = id
+        self.kind = kind
+        self.params = params
+        self.points = points
+        # Для открытых кривых — область, в которой они растеризованы
+        self.extent = extent
+        # Те же пиксели отрезками строк (y, x0, x1[, покрытие]): у заливок — сразу,
+        # у остальных считаются при первой отрисовке элементами
+        self.spans = None if spans is None else as_spans(spans)
+        self.antialiased = len(points) > 0 and len(points[0]) == 3
+        if isinstance(points, np.ndarray):
+            # Точки из файла сцены: без построчного разбора
+            self.coords = np.array(points[:, :2], dtype=float)
+        else:
+            self.coords = np.array([point[:2] for point in points], dtype=float).reshape(-1, 2)
+        if len(self.coords):
+            self.bounds = (*self.coords.min(axis=0).tolist(), *self.coords.max(axis=0).tolist())
+        else:
+            self.bounds = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def mask(self, bounds):
+        x0, y0, x1, y1 = bounds
+        xs = self.coords[:, 0]
+        ys = self.coords[:, 1]
+        return (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+
+    def clip(self, bounds):
+        if self.bounds is None or not intersects(self.bounds, bounds):
+            return []
+        if contains(bounds, self.bounds):
+            return self.points
+        if isinstance(self.points, np.ndarray):
+            return self.points[self.mask(bounds)]
+        return [self.points[i] for i in np.flatnonzero(self.mask(bounds))]
+
+    def row_spans(self):
+        if self.spans is None:
+            self.spans = raster.pixel_spans(self.points)
+        return self.spans
+
+    def clip_spans(self, bounds):
+        return raster.clip_spans(self.row_spans(), bounds)
+
+    def hit(self, x, y, radius):
+        return bool(self.mask((x - radius, y - radius, x + radius, y + radius)).any())
+
+
+class StoredPrimitive(Primitive):
+    # Примитив из отображённого в память файла сцены: пиксели не копируются,
+    # рамка и отсечение берутся по рамкам блоков записи, так что читаются
+    # только страницы файла, попавшие в запрошенную область
+    def __init__(self, id, record):
+        self.id = id
+        self.kind = record.kind
+        self.params = record.params
+        self.record = record
+        self.points = record.points
+        self.extent = record.extent
+        self.spans = None if record.spans is None else as_spans(record.spans)
+        self.antialiased = len(record.points) > 0 and record.points.shape[1] == 3
+        blocks = record.blocks
+        if len(blocks):
+            self.bounds = (float(blocks[:, 0].min()), float(blocks[:, 1].min()),
+                           float(blocks[:, 2].max()), float(blocks[:, 3].max()))
+        else:
+            self.bounds = None
+
+    def clip(self, bounds):
+        if self.bounds is None or not intersects(self.bounds, bounds):
+            return self.points[:0]
+        if contains(bounds, self.bounds):
+            return self.points
+        return self.record.clip(bounds)
+
+    def clip_spans(self, bounds):
+        if self.spans is not None:
+            return raster.clip_spans(self.spans, bounds)
+        return raster.pixel_spans(self.clip(bounds))
+
+    def hit(self, x, y, radius):
+        return len(self.clip((x - radius, y - radius, x + radius, y + radius))) > 0
+
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            inner[2] <= outer[2] and inner[3] <= outer[3])
+
+
+class GridIndex:
+    # Равномерная сетка: ячейка -> примитивы, у которых в ней есть пиксели.
+    # Длинный отрезок попадает только в ячейки вдоль себя, а не во весь свой bbox
+    def __init__(self, cell=GRID_CELL):
+        self.cell = cell
+        self.cells = {}
+
+    def cells_of(self, coords):
+        keys, unpack, _ = raster.pack_cells(np.floor(coords / self.cell))
+        cells = unpack(np.unique(keys)).astype(np.int64)
+        return [tuple(cell) for cell in cells.tolist()]
+
+    def insert(self, id, coords):
+        for cell in self.cells_of(coords):
+            self.cells.setdefault(cell, set()).add(id)
+
+    def remove(self, id, coords):
+        for cell in self.cells_of(coords):
+            ids = self.cells.get(cell)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.cells[cell]
+
+    def query(self, bounds):
+        x0, y0, x1, y1 = (math.floor(v / self.cell) for v in bounds)
+        found = set()
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # Область больше занятой части сетки — дешевле перебрать занятые ячейки
+            for (cx, cy), ids in self.cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    found |= ids
+            return found
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                ids = self.cells.get((cx, cy))
+                if ids:
+                    found |= ids
+        return found
+
+    def clear(self):
+        self.cells.clear()
+
+
+class BlockIndex:
+    # Рамки блоков всех примитивов из файлов сцены одной таблицей: запрос — одна
+    # векторная проверка пересечения, без ячеек сетки по каждому пикселю
+    def __init__(self):
+        self.parts = {}
+        self.boxes = None
+        self.ids = None
+
+    def insert(self, id, boxes):
+        self.parts[id] = boxes
+        self.boxes = None
+
+    def remove(self, id):
+        if self.parts.pop(id, None) is not None:
+            self.boxes = None
+
+    def query(self, bounds):
+        if not self.parts:
+            return set()
+        if self.boxes is None:
+            self.boxes = np.concatenate(list(self.parts.values()))
+            self.ids = np.repeat(list(self.parts), [len(boxes) for boxes in self.parts.values()])
+        x0, y0, x1, y1 = bounds
+        b = self.boxes
+        hit = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+        return set(np.unique(self.ids[hit]).tolist())
+
+    def clear(self):
+        self.parts.clear()
+        self.boxes = None
+
+
+class Scene:
+    def __init__(self, cell=GRID_CELL):
+        self.primitives = {}
+        self.index = GridIndex(cell)
+        self.blocks = BlockIndex()
+        self.next_id = 1
+        # Вызываются с рамкой изменённой области (None — изменилось всё)
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.primitives)
+
+    def __iter__(self):
+        return iter(self.primitives.values())
+
+    def __contains__(self, id):
+        return id in self.primitives
+
+    def __getitem__(self, id):
+        return self.primitives[id]
+
+    def add(self, kind, params, points, extent=None, spans=None):
+        return self.insert(Primitive(self.next_id, kind, params, points, extent, spans))
+
+    def add_record(self, record):
+        # Запись файла сцены (scenefile.Record) без копирования её пикселей
+        return self.insert(StoredPrimitive(self.next_id, record))
+
+    def insert(self, primitive):
+        self.next_id += 1
+        self.primitives[primitive.id] = primitive
+        self.index_primitive(primitive)
+        self.changed(primitive.bounds)
+        return primitive
+
+    def index_primitive(self, primitive):
+        if primitive.record is not None:
+            self.blocks.insert(primitive.id, primitive.record.blocks)
+        else:
+            self.index.insert(primitive.id, primitive.coords)
+
+    def unindex_primitive(self, primitive):
+        if primitive.record is not None:
+            self.blocks.remove(primitive.id)
+        else:
+            self.index.remove(primitive.id, primitive.coords)
+
+    def update(self, id, points, extent=None):
+        # Замена пикселей с сохранением id и места в порядке наложения
+        old = self.primitives[id]
+        self.unindex_primitive(old)
+        primitive = Primitive(id, old.kind, old.params, points, extent)
+        self.primitives[id] = primitive
+        self.index_primitive(primitive)
+        self.changed(old.bounds)
+        self.changed(primitive.bounds)
+        return primitive
+
+    def unbounded(self):
+        return [primitive for primitive in self if primitive.extent is not None]
+
+    def remove(self, id):
+        primitive = self.primitives.pop(id)
+        self.unindex_primitive(primitive)
+        self.changed(primitive.bounds)
+        return primitive
+
+    def clear(self):
+        self.primitives.clear()
+        self.index.clear()
+        self.blocks.clear()
+        for listener in self.listeners:
+            listener(None)
+
+    def changed(self, bounds):
+        if bounds is not None:
+            for listener in self.listeners:
+                listener(bounds)
+
+    def query(self, bounds):
+        # Примитивы в порядке добавления, чтобы наложение совпадало с полной перерисовкой
+        ids = self.index.query(bounds) | self.blocks.query(bounds)
+        return [self.primitives[id] for id in sorted(ids)
+                if intersects(self.primitives[id].bounds, bounds)]
+
+    def hit_test(self, x, y, radius=0.5):
+        for primitive in reversed(self.query((x - radius, y - radius, x + radius, y + radius))):
+            if primitive.hit(x, y, radius):
+                return primitive
+        return None
+
+    def bounds(self):
+        boxes = [primitive.bounds for primitive in self if primitive.bounds is not None]
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
@@ -0,0 +1,185 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"GIISSCN\0"
+VERSION = 1
+# magic, версия, смещение и длина оглавления
+HEADER = struct.Struct("<8sIxxxxQQ")
+BLOCK_POINTS = 4096
+ALIGN = 8
+
+
+class SceneFileError(ValueError):
+    pass
+
+
+def as_tuples(value):
+    # JSON превращает кортежи в списки, а параметры служат ключами кэша
+    if isinstance(value, list):
+        return tuple(as_tuples(item) for item in value)
+    if isinstance(value, dict):
+        return {key: as_tuples(item) for key, item in value.items()}
+    return value
+
+
+def block_bounds(points):
+    # Точки кривой идут вдоль неё, поэтому соседние точки блока лежат рядом
+    starts = np.arange(0, len(points), BLOCK_POINTS)
+    if not len(starts):
+        return np.empty((0, 4))
+    xs = points[:, 0]
+    ys = points[:, 1]
+    return np.column_stack((np.minimum.reduceat(xs, starts), np.minimum.reduceat(ys, starts),
+                            np.maximum.reduceat(xs, starts), np.maximum.reduceat(ys, starts)))
+
+
+def as_points(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.size == 0:
+        return np.empty((0, 2))
+    if points.ndim != 2 or points.shape[1] not in (2, 3):
+        raise SceneFileError("Точки должны быть парами (x, y) или тройками (x, y, покрытие)")
+    return points
+
+
+def save_scene(path, primitives, control_points=()):
+    # Файл: заголовок, выровненные массивы точек и рамок блоков, оглавление в JSON.
+    # Пишется во временный файл: старый может быть отображён в память открытой сценой
+    entries = []
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(b"\0" * HEADER.size)
+
+        def write_array(array):
+            file.write(b"\0" * (-file.tell() % ALIGN))
+            offset = file.tell()
+            file.write(np.ascontiguousarray(array, dtype="<f8").tobytes())
+            return offset
+
+        for primitive in primitives:
+            points = as_points(primitive.points)
+            blocks = block_bounds(points)
+            entry = {
+                "kind": primitive.kind,
+                "params": primitive.params,
+                "extent": primitive.extent,
+                "count": len(points),
+                "dims": points.shape[1],
+                "points": write_array(points),
+                "blocks": write_array(blocks),
+            }
+            if primitive.spans is not None:
+                entry["spans"] = write_array(primitive.spans)
+                entry["span_count"], entry["span_dims"] = primitive.spans.shape
+            entries.append(entry)
+
+        index = json.dumps({"primitives": entries,
+                            "control_points": list(control_points)}).encode("utf-8")
+        index_offset = file.tell()
+        file.write(index)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, index_offset, len(index)))
+    os.replace(tmp_path, path)
+
+
+def save_points(path, points, kind="points"):
+    save_scene(path, [Record(kind, None, None, as_points(points))])
+
+
+class Record:
+    def __init__(self, kind, params, extent, points, blocks=None, spans=None):
+        self.kind = kind
+        self.params = params
+        self.extent = extent
+        self.points = points
+        self.blocks = block_bounds(points) if blocks is None else blocks
+        self.spans = spans
+
+    def __len__(self):
+        return len(self.points)
+
+    def clip(self, bounds):
+        # Читаются только блоки, чьи рамки задевают область, — остальные страницы
+        # файла так и не попадают в память
+        x0, y0, x1, y1 = bounds
+        b = self.blocks
+        hit = np.flatnonzero((b[:, 0] <= x1) & (b[:, 2] >= x0) &
+                             (b[:, 1] <= y1) & (b[:, 3] >= y0))
+        if not len(hit):
+            return self.points[:0]
+        parts = [self.points[i * BLOCK_POINTS:(i + 1) * BLOCK_POINTS] for i in hit]
+        points = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        xs = points[:, 0]
+        ys = points[:, 1]
+        return points[(xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)]
+
+
+class SceneFile:
+    # Файл отображается в память целиком, массивы точек — представления без копирования
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        except ValueError:
+            raise SceneFileError(f"Пустой файл: {path}") from None
+        if len(self.data) < HEADER.size:
+            raise SceneFileError(f"Файл слишком короткий: {path}")
+        magic, version, index_offset, index_length = HEADER.unpack(
+            self.data[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise SceneFileError(f"Это не файл сцены: {path}")
+        if version != VERSION:
+            raise SceneFileError(f"Неподдерживаемая версия файла сцены: {version}")
+        try:
+            index = json.loads(self.data[index_offset:index_offset + index_length].tobytes())
+        except ValueError:
+            raise SceneFileError(f"Повреждено оглавление файла сцены: {path}") from None
+
+        try:
+            self.read_index(index)
+        except (KeyError, TypeError, AttributeError):
+            raise SceneFileError(f"Повреждено оглавление файла сцены: {self.path}") from None
+
+    def read_index(self, index):
+        self.control_points = [tuple(point) for point in index["control_points"]]
+        self.records = []
+        for entry in index["primitives"]:
+            count = entry["count"]
+            points = self.array(entry["points"], count * entry["dims"]).reshape(count,
+                                                                                entry["dims"])
+            blocks = self.array(entry["blocks"], -(-count // BLOCK_POINTS) * 4).reshape(-1, 4)
+            extent = tuple(entry["extent"]) if entry["extent"] is not None else None
+            spans = None
+            if "spans" in entry:
+                dims = entry.get("span_dims", 3)
+                spans = self.array(entry["spans"], entry["span_count"] * dims).reshape(-1, dims)
+                if dims == 3:
+                    spans = spans.astype(np.int64)
+            self.records.append(Record(entry["kind"], as_tuples(entry["params"]), extent,
+                                       points, blocks, spans))
+
+    def array(self, offset, length):
+        end = offset + length * 8
+        if end > len(self.data):
+            raise SceneFileError(f"Файл сцены обрезан: {self.path}")
+        return self.data[offset:end].view("<f8")
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+def load_points(path, bounds=None):
+    # Все точки файла подряд; с bounds — только попадающие в область
+    records = SceneFile(path).records
+    parts = [record.points if bounds is None else record.clip(bounds) for record in records]
+    if not parts:
+        return np.empty((0, 2))
+    if len({part.shape[1] for part in parts}) > 1:
+        parts = [part[:, :2] for part in parts]
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
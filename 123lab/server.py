@@ -0,0 +1,589 @@
+import argparse
+import json
+import math
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import raster
+import rasterize
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7654
+# Сколько ждать попутчиков для пакета отрезков и сколько отрезков брать в пакет
+BATCH_DELAY = 0.002
+BATCH_SEGMENTS = 65536
+MAX_PAYLOAD = 64 * 2**20
+# Как и MAX_PAYLOAD, ограничивают один запрос: оценка числа пикселей делается до
+# растеризации, иначе окружность с огромным радиусом в 12 байтах займёт гигабайты.
+# Открытые кривые заданий без рамки строятся в пределах MAX_COORD
+MAX_PIXELS = 2**24
+MAX_COORD = 2**16
+RATE_WINDOW = 10.0
+
+# Запрос: номер, операция, формат ответа, длина данных.
+# Ответ: номер, состояние, длина данных (при ошибке — текст ошибки в UTF-8)
+REQUEST = struct.Struct("<IBBxxI")
+RESPONSE = struct.Struct("<IBxxxI")
+LINE_HEADER = struct.Struct("<B3x")
+COUNT = struct.Struct("<I")
+
+OP_LINES = 1
+OP_CIRCLES = 2
+OP_ELLIPSES = 3
+OP_HERMITE = 4
+OP_BEZIER = 5
+OP_BSPLINE = 6
+OP_JOB = 7
+OP_STATS = 8
+
+OP_NAMES = {
+    OP_LINES: "lines",
+    OP_CIRCLES: "circles",
+    OP_ELLIPSES: "ellipses",
+    OP_HERMITE: "hermite",
+    OP_BEZIER: "bezier",
+    OP_BSPLINE: "bspline",
+    OP_JOB: "job",
+    OP_STATS: "stats",
+}
+
+SPLINES = {
+    OP_HERMITE: raster.iter_adaptive_hermite,
+    OP_BEZIER: raster.iter_adaptive_bezier,
+    OP_BSPLINE: raster.iter_adaptive_bspline,
+}
+
+CUBICS = {
+    OP_HERMITE: raster.hermite_cubics,
+    OP_BEZIER: raster.bezier_cubics,
+    OP_BSPLINE: raster.bspline_cubics,
+}
+
+# Формат ответа: пиксели (число, int32 x y, uint8 r g b) или изображение
+FORMAT_PIXELS = 0
+FORMAT_PNG = 1
+FORMAT_PPM = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+ALGORITHMS = tuple(rasterize.LINE_BATCHES)
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def int_array(payload, columns, offset=0):
+    if (len(payload) - offset) % (4 * columns):
+        raise ProtocolError(f"Ожидаются строки из {columns} чисел int32")
+    data = np.frombuffer(payload, dtype="<i4", offset=offset)
+    return data.reshape(-1, columns).astype(np.int64)
+
+
+def check_pixels(count):
+    if count > MAX_PIXELS:
+        raise ProtocolError(f"Слишком большой результат: около {int(count)} пикселей "
+                            f"(предел {MAX_PIXELS})")
+
+
+def line_pixels(segments):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    lengths = np.maximum(np.abs(segments[:, 2] - segments[:, 0]),
+                         np.abs(segments[:, 3] - segments[:, 1]))
+    return float((lengths + 1).sum())
+
+
+def cubic_pixels(cubics):
+    # Кривая лежит внутри ломаной своих управляющих точек и не длиннее её
+    total = 0.0
+    for cubic in cubics:
+        xs = cubic[0::2]
+        ys = cubic[1::2]
+        total += sum(max(abs(xs[i + 1] - xs[i]), abs(ys[i + 1] - ys[i])) for i in range(3)) + 1
+    return total
+
+
+def job_pixels(job):
+    # Грубая верхняя оценка для задания rasterize.py; неполные примитивы
+    # пропускаются — об ошибке в них сообщит сама растеризация
+    total = 0.0
+    bounds = job.get("bounds")
+    if bounds is None:
+        bounds = (-job["max_coord"], -job["max_coord"], job["max_coord"], job["max_coord"])
+    conic = 4 * ((bounds[2] - bounds[0]) + (bounds[3] - bounds[1]) + 2)
+    for primitive in job["primitives"]:
+        kind = primitive.get("type")
+        points = primitive.get("points", [])
+        if kind == "line" and "start" in primitive and "end" in primitive:
+            total += line_pixels([*primitive["start"], *primitive["end"]])
+        elif kind == "circle":
+            total += 8 * abs(primitive.get("radius", 0)) + 8
+        elif kind == "ellipse":
+            total += 4 * (abs(primitive.get("a", 0)) + abs(primitive.get("b", 0))) + 8
+        elif kind in ("hyperbola", "parabola"):
+            total += conic
+        elif kind == "hermite":
+            total += cubic_pixels(raster.hermite_cubics(points))
+        elif kind == "bezier":
+            total += cubic_pixels(raster.bezier_cubics(points))
+        elif kind == "bspline" and len(points):
+            # Отсчёты соединяются отрезками, а кривая не длиннее ломаной своих точек
+            total += line_pixels([(*a, *b) for a, b in zip(points, points[1:])])
+            total += primitive.get("samples", raster.BSPLINE_SAMPLES)
+        elif kind == "polygon" and len(points):
+            xs = [point[0] for point in points]
+            ys = [point[1] for point in points]
+            total += (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1)
+    return total
+
+
+def encode_pixels(points, colors):
+    return (COUNT.pack(len(points)) + np.ascontiguousarray(points, dtype="<i4").tobytes() +
+            np.ascontiguousarray(colors, dtype=np.uint8).tobytes())
+
+
+def decode_pixels(data):
+    (count,) = COUNT.unpack_from(data)
+    end = COUNT.size + count * 8
+    points = np.frombuffer(data, dtype="<i4", count=count * 2, offset=COUNT.size)
+    colors = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=end)
+    return points.reshape(count, 2).astype(np.int64), colors.reshape(count, 3)
+
+
+def encode_result(points, colors, output):
+    if output == FORMAT_PIXELS:
+        return encode_pixels(points, colors)
+    pixels = rasterize.render_image(points, colors)
+    if output == FORMAT_PNG:
+        return rasterize.encode_png(pixels)
+    if output == FORMAT_PPM:
+        return rasterize.encode_ppm(pixels)
+    raise ProtocolError(f"Неизвестный формат ответа: {output}")
+
+
+def solid(points):
+    points = np.floor(np.asarray(points, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    return points, np.zeros((len(points), 3), dtype=np.uint8)
+
+
+class Metrics:
+    # Счётчики сервера: запросы и пиксели по операциям, пакеты отрезков,
+    # глубина очереди и задержки. Обновляются из разных потоков под замком
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}
+        self.errors = 0
+        self.pixels = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = 0.0
+        self.latency_max = 0.0
+        self.batches = 0
+        self.batched_requests = 0
+        self.batched_segments = 0
+        self.active = 0
+        self.active_max = 0
+        self.queue_max = 0
+        self.recent = deque()
+
+    def begin(self):
+        with self.lock:
+            self.active += 1
+            self.active_max = max(self.active_max, self.active)
+
+    def end(self, op, pixels, seconds, bytes_in, bytes_out, error=False):
+        now = time.time()
+        with self.lock:
+            self.active -= 1
+            name = OP_NAMES.get(op, str(op))
+            self.requests[name] = self.requests.get(name, 0) + 1
+            self.errors += error
+            self.pixels += pixels
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.latency += seconds
+            self.latency_max = max(self.latency_max, seconds)
+            self.recent.append((now, pixels))
+            while self.recent and self.recent[0][0] < now - RATE_WINDOW:
+                self.recent.popleft()
+
+    def batch(self, requests, segments):
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += requests
+            self.batched_segments += segments
+
+    def queued(self, depth):
+        with self.lock:
+            self.queue_max = max(self.queue_max, depth)
+
+    def snapshot(self, queue_depth=0):
+        now = time.time()
+        with self.lock:
+            uptime = now - self.started
+            total = sum(self.requests.values())
+            recent = [entry for entry in self.recent if entry[0] >= now - RATE_WINDOW]
+            window = min(RATE_WINDOW, uptime) or 1.0
+            return {
+                "uptime": uptime,
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "pixels": self.pixels,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "requests_per_second": total / uptime if uptime else 0.0,
+                "pixels_per_second": self.pixels / uptime if uptime else 0.0,
+                "recent_requests_per_second": len(recent) / window,
+                "recent_pixels_per_second": sum(pixels for _, pixels in recent) / window,
+                "latency_mean": self.latency / total if total else 0.0,
+                "latency_max": self.latency_max,
+                "batches": self.batches,
+                "requests_per_batch": (self.batched_requests / self.batches
+                                       if self.batches else 0.0),
+                "segments_per_batch": (self.batched_segments / self.batches
+                                       if self.batches else 0.0),
+                "active": self.active,
+                "active_max": self.active_max,
+                "queue_depth": queue_depth,
+                "queue_max": self.queue_max,
+            }
+
+
+class PendingLines:
+    def __init__(self, algorithm, segments):
+        self.algorithm = algorithm
+        self.segments = segments
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LineBatcher:
+    # Отрезки из одновременных запросов склеиваются в один вызов пакетного алгоритма:
+    # поток пакетов берёт первый запрос из очереди, ждёт попутчиков не дольше delay
+    # и раздаёт каждому запросу его часть результата по смещениям отрезков.
+    # Склеиваются только отрезки: окружности, эллипсы и заливки строятся по одной
+    # фигуре, и общий вызов на несколько запросов ничего бы не сэкономил
+    def __init__(self, metrics, delay=BATCH_DELAY, max_segments=BATCH_SEGMENTS):
+        self.metrics = metrics
+        self.delay = delay
+        self.max_segments = max_segments
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def depth(self):
+        return self.pending.qsize()
+
+    def submit(self, algorithm, segments):
+        request = PendingLines(algorithm, segments)
+        self.pending.put(request)
+        self.metrics.queued(self.pending.qsize())
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            count = len(batch[0].segments)
+            deadline = time.perf_counter() + self.delay
+            while count < self.max_segments:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                count += len(request.segments)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.algorithm, []).append(request)
+            for algorithm, requests in groups.items():
+                try:
+                    self.process(algorithm, requests)
+                except Exception as error:
+                    for request in requests:
+                        request.error = error
+                for request in requests:
+                    request.done.set()
+
+    def process(self, algorithm, requests):
+        segments = np.concatenate([request.segments for request in requests])
+        self.metrics.batch(len(requests), len(segments))
+        result = rasterize.LINE_BATCHES[algorithm](segments)
+        points, offsets = result[0], result[-1]
+        coverage = result[1] if algorithm == "wu" else None
+
+        first = 0
+        for request in requests:
+            last = first + len(request.segments)
+            begin, end = offsets[first], offsets[last]
+            if coverage is None:
+                request.result = solid(points[begin:end])
+            else:
+                # Сглаженные отрезки запроса смешиваются между собой, как в rasterize.py
+                buffer = raster.CoverageBuffer()
+                buffer.deposit(points[begin:end], coverage[begin:end])
+                cells, colors = buffer.resolve()
+                request.result = np.floor(cells).astype(np.int64), colors
+            first = last
+
+
+def run_operation(server, op, payload):
+    if op == OP_LINES:
+        if len(payload) < LINE_HEADER.size:
+            raise ProtocolError("Нет заголовка отрезков")
+        (algorithm,) = LINE_HEADER.unpack_from(payload)
+        if algorithm >= len(ALGORITHMS):
+            raise ProtocolError(f"Неизвестный алгоритм отрезка: {algorithm}")
+        segments = int_array(payload, 4, LINE_HEADER.size)
+        if not len(segments):
+            return solid([])
+        check_pixels(line_pixels(segments))
+        return server.batcher.submit(ALGORITHMS[algorithm], segments)
+    if op == OP_CIRCLES:
+        circles = int_array(payload, 3)
+        check_pixels(float((8 * np.abs(circles[:, 2]) + 8).sum()))
+        parts = [raster.circle_pixels(xc, yc, r, math.inf) for xc, yc, r in circles.tolist()]
+        return solid(np.concatenate(parts) if parts else [])
+    if op == OP_ELLIPSES:
+        ellipses = int_array(payload, 4)
+        check_pixels(float((4 * np.abs(ellipses[:, 2:]).sum(axis=1) + 8).sum()))
+        parts = [raster.ellipse_pixels(xc, yc, a, b) for xc, yc, a, b in ellipses.tolist()]
+        return solid(np.concatenate(parts) if parts else [])
+    if op in SPLINES:
+        points = [tuple(point) for point in int_array(payload, 2).tolist()]
+        rasterize.control_points({"type": OP_NAMES[op], "points": points})
+        check_pixels(cubic_pixels(CUBICS[op](points)))
+        return solid(list(SPLINES[op](points)))
+    if op == OP_JOB:
+        # Остальное (гиперболы, параболы, заливки, цвета) — задание rasterize.py в JSON
+        try:
+            job = json.loads(payload)
+        except ValueError:
+            raise ProtocolError("Некорректный JSON задания") from None
+        if not isinstance(job, dict):
+            job = {"primitives": job}
+        rasterize.check_job(job)
+        job["max_coord"] = min(job.get("max_coord", MAX_COORD), MAX_COORD)
+        check_pixels(job_pixels(job))
+        return rasterize.rasterize_primitives(job)
+    raise ProtocolError(f"Неизвестная операция: {op}")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    # Соединение держится, пока клиент шлёт запросы; ответы идут в порядке запросов
+    def handle(self):
+        try:
+            self.serve_requests()
+        except ConnectionError:
+            pass
+
+    def serve_requests(self):
+        while True:
+            header = self.rfile.read(REQUEST.size)
+            if len(header) < REQUEST.size:
+                return
+            number, op, output, length = REQUEST.unpack(header)
+            if length > MAX_PAYLOAD:
+                self.reply(number, STATUS_ERROR, "Слишком большой запрос".encode("utf-8"))
+                return
+            payload = self.rfile.read(length)
+            if len(payload) < length:
+                return
+            self.respond(number, op, output, payload)
+
+    def respond(self, number, op, output, payload):
+        metrics = self.server.metrics
+        metrics.begin()
+        start = time.perf_counter()
+        pixels = 0
+        data = b""
+        status = STATUS_ERROR
+        try:
+            if op == OP_STATS:
+                data = json.dumps(self.server.stats()).encode("utf-8")
+            else:
+                points, colors = run_operation(self.server, op, payload)
+                pixels = len(points)
+                data = encode_result(points, colors, output)
+            status = STATUS_OK
+        except Exception as error:
+            # Любая ошибка запроса уходит клиенту ответом, соединение остаётся открытым
+            message = str(error) if isinstance(error, ValueError) else repr(error)
+            data = message.encode("utf-8")
+        finally:
+            metrics.end(op, pixels, time.perf_counter() - start,
+                        REQUEST.size + len(payload), RESPONSE.size + len(data),
+                        status != STATUS_OK)
+        self.reply(number, status, data)
+
+    def reply(self, number, status, data):
+        self.wfile.write(RESPONSE.pack(number, status, len(data)) + data)
+        self.wfile.flush()
+
+
+class RasterServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_raster(self, delay, max_segments):
+        self.metrics = Metrics()
+        self.batcher = LineBatcher(self.metrics, delay, max_segments)
+
+    def stats(self):
+        return self.metrics.snapshot(self.batcher.depth)
+
+
+class TCPRasterServer(RasterServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixRasterServer(RasterServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+
+
+def make_server(address, delay=BATCH_DELAY, max_segments=BATCH_SEGMENTS):
+    # Строка — путь Unix-сокета, пара (хост, порт) — TCP
+    if isinstance(address, str):
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            raise ValueError("Unix-сокеты не поддерживаются в этой системе")
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixRasterServer(address, RequestHandler)
+    else:
+        server = TCPRasterServer(address, RequestHandler)
+    server.setup_raster(delay, max_segments)
+    return server
+
+
+class ServerError(Exception):
+    pass
+
+
+class Client:
+    # Клиент для других программ: запросы идут по одному соединению по очереди
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT)):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.file = self.sock.makefile("rb")
+        self.number = 0
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, op, payload=b"", output=FORMAT_PIXELS):
+        data = self.exchange(op, payload, output)
+        return decode_pixels(data) if output == FORMAT_PIXELS else data
+
+    def exchange(self, op, payload=b"", output=FORMAT_PIXELS):
+        self.number += 1
+        self.sock.sendall(REQUEST.pack(self.number, op, output, len(payload)) + payload)
+        header = self.file.read(RESPONSE.size)
+        if len(header) < RESPONSE.size:
+            raise ServerError("Сервер закрыл соединение")
+        number, status, length = RESPONSE.unpack(header)
+        data = self.file.read(length)
+        if number != self.number or len(data) < length:
+            raise ServerError("Нарушен порядок ответов")
+        if status != STATUS_OK:
+            raise ServerError(data.decode("utf-8"))
+        return data
+
+    def lines(self, segments, algorithm="bresenham", output=FORMAT_PIXELS):
+        segments = np.asarray(segments, dtype="<i4").reshape(-1, 4)
+        payload = LINE_HEADER.pack(ALGORITHMS.index(algorithm)) + segments.tobytes()
+        return self.request(OP_LINES, payload, output)
+
+    def circles(self, circles, output=FORMAT_PIXELS):
+        return self.request(OP_CIRCLES, np.asarray(circles, dtype="<i4").tobytes(), output)
+
+    def ellipses(self, ellipses, output=FORMAT_PIXELS):
+        return self.request(OP_ELLIPSES, np.asarray(ellipses, dtype="<i4").tobytes(), output)
+
+    def spline(self, kind, control_points, output=FORMAT_PIXELS):
+        op = {name: op for op, name in OP_NAMES.items()}[kind]
+        if op not in SPLINES:
+            raise ValueError(f"Неизвестный тип кривой: {kind!r}")
+        return self.request(op, np.asarray(control_points, dtype="<i4").tobytes(), output)
+
+    def job(self, job, output=FORMAT_PIXELS):
+        return self.request(OP_JOB, json.dumps(job).encode("utf-8"), output)
+
+    def stats(self):
+        return json.loads(self.exchange(OP_STATS))
+
+
+def parse_address(text):
+    # "путь/к/сокету" или "хост:порт"
+    if ":" in text:
+        host, port = text.rsplit(":", 1)
+        return host or DEFAULT_HOST, int(port)
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный сервер растеризации")
+    parser.add_argument("address", nargs="?", default=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        help="хост:порт или путь Unix-сокета")
+    parser.add_argument("--batch-delay", type=float, default=BATCH_DELAY * 1000,
+                        help="ожидание попутных запросов отрезков, мс")
+    parser.add_argument("--batch-segments", type=int, default=BATCH_SEGMENTS,
+                        help="наибольшее число отрезков в пакете")
+    parser.add_argument("--stats", type=float, default=0,
+                        help="печатать метрики каждые N секунд")
+    args = parser.parse_args(argv)
+
+    try:
+        server = make_server(parse_address(args.address), args.batch_delay / 1000,
+                             args.batch_segments)
+    except (OSError, ValueError) as error:
+        print(f"Ошибка: {error}", file=sys.stderr)
+        return 2
+
+    if args.stats:
+        def report():
+            while True:
+                time.sleep(args.stats)
+                print(json.dumps(server.stats(), ensure_ascii=False), file=sys.stderr,
+                      flush=True)
+        threading.Thread(target=report, daemon=True).start()
+
+    print(f"Сервер растеризации: {args.address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+import raster
+
+TILE = 256
+TILE_BYTES = 64 * 2**20
+MAX_LEVEL = 16
+
+
+def level_for(cell_px):
+    # Уровень, на котором ячейка уровня занимает не меньше одного экранного пикселя
+    if cell_px >= 1:
+        return 0
+    return min(MAX_LEVEL, math.ceil(math.log2(1 / cell_px)))
+
+
+def tile_range(bounds, level):
+    span = TILE << level
+    x0, y0, x1, y1 = bounds
+    return (math.floor(x0 / span), math.floor(y0 / span),
+            math.floor(x1 / span), math.floor(y1 / span))
+
+
+class TileCache:
+    # Мип-пирамида занятости мира: ячейка уровня level — квадрат 2**level пикселей,
+    # её значение — наибольшая плотность (0..255) среди них. Плитки TILE x TILE ячеек
+    # строятся по запросу и вытесняются, когда их объём больше max_bytes
+    def __init__(self, scene, max_bytes=TILE_BYTES):
+        self.scene = scene
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+        scene.listeners.append(self.invalidate)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        children = [(level - 1, 2 * tx + dx, 2 * ty + dy) for dy in (0, 1) for dx in (0, 1)]
+        if level and all(child in self.tiles for child in children):
+            tile = self.reduce([self.tiles[child] for child in children])
+        else:
+            tile = self.build(level, tx, ty)
+        self.store(key, tile)
+        return tile
+
+    def build(self, level, tx, ty):
+        # Плитка собирается прямо из пикселей сцены: сглаженные пиксели сначала
+        # смешиваются, как при обычной отрисовке, потом берётся максимум по ячейке уровня
+        span = TILE << level
+        bounds = (tx * span, ty * span, (tx + 1) * span - 1, (ty + 1) * span - 1)
+        buffer = raster.CoverageBuffer()
+        for primitive in self.scene.query(bounds):
+            points = np.asarray(primitive.clip(bounds), dtype=np.float64)
+            if len(points):
+                buffer.deposit(points[:, :2], points[:, 2] if points.shape[1] == 3 else 1.0)
+        if not len(buffer):
+            return None
+        cells, rgb = buffer.resolve()
+        if not len(cells):
+            return None
+        local = (cells.astype(np.int64) - (tx * span, ty * span)) >> level
+        tile = np.zeros((TILE, TILE), dtype=np.uint8)
+        np.maximum.at(tile, (local[:, 1], local[:, 0]), 255 - rgb[:, 0])
+        return tile
+
+    def reduce(self, children):
+        if all(child is None for child in children):
+            return None
+        full = np.zeros((2 * TILE, 2 * TILE), dtype=np.uint8)
+        for i, child in enumerate(children):
+            if child is not None:
+                row, col = divmod(i, 2)
+                full[row * TILE:(row + 1) * TILE, col * TILE:(col + 1) * TILE] = child
+        return full.reshape(TILE, 2, TILE, 2).max(axis=(1, 3))
+
+    def store(self, key, tile):
+        self.tiles[key] = tile
+        self.nbytes += tile.nbytes if tile is not None else 0
+        while self.nbytes > self.max_bytes:
+            _, old = self.tiles.popitem(last=False)
+            self.nbytes -= old.nbytes if old is not None else 0
+
+    def cells(self, bounds, level):
+        # Занятые ячейки уровня в области: координаты ячеек и плотность
+        tx0, ty0, tx1, ty1 = tile_range(bounds, level)
+        xs, ys, values = [], [], []
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                tile = self.tile(level, tx, ty)
+                if tile is None:
+                    continue
+                rows, cols = np.nonzero(tile)
+                xs.append(cols + tx * TILE)
+                ys.append(rows + ty * TILE)
+                values.append(tile[rows, cols])
+        if not xs:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=np.uint8)
+        return np.concatenate(xs), np.concatenate(ys), np.concatenate(values)
+
+    def invalidate(self, bounds=None):
+        if bounds is None:
+            self.clear()
+            return
+        for key in list(self.tiles):
+            level, tx, ty = key
+            span = TILE << level
+            if (tx * span <= bounds[2] and bounds[0] < (tx + 1) * span and
+                    ty * span <= bounds[3] and bounds[1] < (ty + 1) * span):
+                tile = self.tiles.pop(key)
+                self.nbytes -= tile.nbytes if tile is not None else 0
+
+    def clear(self):
+        self.tiles.clear()
+        self.nbytes = 0
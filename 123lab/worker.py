@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+
+import raster
+
+CHUNK = 4096
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, worker, generation, compute):
+        self.worker = worker
+        self.generation = generation
+        self.compute = compute
+        self.count = 0
+        # Пиксели результата: у взятого из кэша задания count остаётся нулём
+        self.pixels = 0
+
+    @property
+    def cancelled(self):
+        return self.generation != self.worker.generation
+
+    def collect(self, pixels):
+        # Проходит генератор кусками: каждый кусок сразу уходит в окно,
+        # между кусками проверяется, не отменено ли задание
+        points = []
+        for chunk in raster.iter_chunks(pixels, self.worker.chunk):
+            self.send(chunk)
+            points.extend(chunk)
+        return points
+
+    def send(self, chunk):
+        # Готовый кусок (например, массив пикселей из кэша) уходит в окно целиком
+        if self.cancelled:
+            raise Cancelled
+        self.count += len(chunk)
+        self.worker.results.put(("chunk", self.generation, chunk))
+
+
+class RenderWorker:
+    # Один фоновый поток растеризации. Новое задание заменяет текущее: у каждого
+    # задания своё поколение, результаты устаревших поколений отбрасываются.
+    # С Tk работает только поток окна — он забирает результаты через poll()
+    def __init__(self, chunk=CHUNK):
+        self.chunk = chunk
+        self.generation = 0
+        self.finished = 0
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = None
+
+    @property
+    def busy(self):
+        return self.generation != self.finished
+
+    def submit(self, compute):
+        # compute(job) выполняется в фоновом потоке и возвращает результат задания
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.generation += 1
+        self.requests.put(Job(self, self.generation, compute))
+        return self.generation
+
+    def cancel(self):
+        if self.busy:
+            self.generation += 1
+            self.finished = self.generation
+
+    def run(self):
+        while True:
+            job = self.requests.get()
+            if job.cancelled:
+                continue
+            try:
+                # Время расчёта уходит вместе с результатом: профилировщик живёт
+                # в потоке окна и записывает его как этап растеризации
+                start = time.perf_counter()
+                result = job.compute(job)
+                seconds = time.perf_counter() - start
+                self.results.put(("done", job.generation, (result, seconds, job.pixels)))
+            except Cancelled:
+                pass
+            except Exception as error:
+                self.results.put(("error", job.generation, error))
+
+    def poll(self):
+        # Сообщения текущего задания, накопившиеся с прошлого опроса
+        messages = []
+        while True:
+            try:
+                kind, generation, value = self.results.get_nowait()
+            except queue.Empty:
+                return messages
+            if generation != self.generation:
+                continue
+            if kind != "chunk":
+                self.finished = generation
+            messages.append((kind, value))